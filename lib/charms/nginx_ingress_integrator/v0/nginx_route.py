@@ -123,6 +123,11 @@ class NginxRouteRequirer(ops.framework.Object):
     """This class defines the functionality for the 'requires' side of the 'nginx-route' relation.
 
     Hook events observed:
+        - config-changed
+        - upgrade-charm
+        - leader-elected
+        - relation-created
+        - relation-joined
         - relation-changed
     """
 
@@ -143,31 +148,43 @@ class NginxRouteRequirer(ops.framework.Object):
         super().__init__(charm, nginx_route_relation_name)
         self._charm = charm
         self._nginx_route_relation_name = nginx_route_relation_name
-        self._charm.framework.observe(
-            self._charm.on[self._nginx_route_relation_name].relation_changed,
-            self._config_reconciliation,
-        )
+        # The config can only change on these hooks, so other hooks such as
+        # update-status leave the relation data alone.
+        relation_events = self._charm.on[self._nginx_route_relation_name]
+        for event in (
+            self._charm.on.config_changed,
+            self._charm.on.upgrade_charm,
+            self._charm.on.leader_elected,
+            relation_events.relation_created,
+            relation_events.relation_joined,
+            relation_events.relation_changed,
+        ):
+            self._charm.framework.observe(event, self._config_reconciliation)
         # Set default values.
         self.config: typing.Dict[str, typing.Union[str, int, bool]] = {
             "service-namespace": self._charm.model.name,
             **config,
         }
-        self._config_reconciliation(None)
 
     def _config_reconciliation(self, _event: typing.Any = None) -> None:
-        """Update the nginx-route relation data to be exactly as defined by config."""
+        """Update the nginx-route relation data to be exactly as defined by config.
+
+        Only stray keys are deleted and only keys whose value differs are written,
+        so that the provider is not woken up when nothing changed.
+        """
         if not self._charm.model.unit.is_leader():
             return
+        desired = {k: str(v) for k, v in self.config.items()}
         for relation in self._charm.model.relations[self._nginx_route_relation_name]:
             relation_app_data = relation.data[self._charm.app]
             delete_keys = {
-                relation_field
-                for relation_field in relation_app_data
-                if relation_field not in self.config
+                relation_field for relation_field in relation_app_data if relation_field not in desired
             }
             for delete_key in delete_keys:
                 del relation_app_data[delete_key]
-            relation_app_data.update({k: str(v) for k, v in self.config.items()})
+            updates = {k: v for k, v in desired.items() if relation_app_data.get(k) != v}
+            if updates:
+                relation_app_data.update(updates)
 
 
 # C901 is ignored since the method has too many ifs but wouldn't be
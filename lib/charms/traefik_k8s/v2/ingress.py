@@ -56,7 +56,7 @@ import logging
 import socket
 import typing
 from dataclasses import dataclass
-from functools import partial
+from functools import lru_cache, partial
 from typing import (
     Any,
     Callable,
@@ -86,6 +86,10 @@ LIBAPI = 2
 # to 0 if you are raising the major API version
 LIBPATCH = 15
 
+# Local divergence from upstream LIBPATCH 15, not to be published: DatabagModel
+# loads are memoized (_LOAD_MEMO) and IngressPerAppRequirer skips identical
+# databag writes. Re-apply both when fetching a newer version of this library.
+
 PYDEPS = ["pydantic"]
 
 DEFAULT_RELATION_NAME = "ingress"
@@ -94,12 +98,36 @@ RELATION_INTERFACE = "ingress"
 log = logging.getLogger(__name__)
 BUILTIN_JUJU_KEYS = {"ingress-address", "private-address", "egress-subnets"}
 
+# Databag contents already parsed in this dispatch, keyed on the model and the raw
+# values of its fields: the same databags are typically read several times per event.
+# Cleared whenever an ingress endpoint is instantiated, i.e. once per dispatch.
+_LOAD_MEMO: Dict[Tuple[type, Tuple[Tuple[str, str], ...]], Any] = {}
+_LOAD_MEMO_SIZE = 64
+
+
+def _memo_key(cls: type, databag: MutableMapping, keys: typing.AbstractSet[str]):
+    """Build the memo key of a databag for the given model."""
+    return cls, tuple(sorted((k, v) for k, v in databag.items() if k in keys))
+
+
+def _memo_store(key: Tuple[type, Tuple[Tuple[str, str], ...]], model: Any):
+    """Remember a parsed databag, evicting the oldest entry once the memo is full."""
+    if len(_LOAD_MEMO) >= _LOAD_MEMO_SIZE:
+        del _LOAD_MEMO[next(iter(_LOAD_MEMO))]
+    _LOAD_MEMO[key] = model
+
+
 PYDANTIC_IS_V1 = int(pydantic.version.VERSION.split(".")[0]) < 2
 if PYDANTIC_IS_V1:
     from pydantic import validator
 
     input_validator = partial(validator, pre=True)
 
+    @lru_cache(maxsize=None)
+    def _field_aliases(cls) -> typing.FrozenSet[str]:
+        """Return the databag keys of a model's fields."""
+        return frozenset(f.alias for f in cls.__fields__.values())  # type: ignore
+
     class DatabagModel(BaseModel):  # type: ignore
         """Base databag model."""
 
@@ -117,25 +145,29 @@ if PYDANTIC_IS_V1:
             if cls._NEST_UNDER:
                 return cls.parse_obj(json.loads(databag[cls._NEST_UNDER]))
 
+            # Don't attempt to parse model-external values
+            key = _memo_key(cls, databag, _field_aliases(cls))
+            if key in _LOAD_MEMO:
+                # a copy, so that callers assigning to its fields do not alter the memo
+                return _LOAD_MEMO[key].copy()
+
             try:
-                data = {
-                    k: json.loads(v)
-                    for k, v in databag.items()
-                    # Don't attempt to parse model-external values
-                    if k in {f.alias for f in cls.__fields__.values()}  # type: ignore
-                }
+                data = {k: json.loads(v) for k, v in key[1]}
             except json.JSONDecodeError as e:
                 msg = f"invalid databag contents: expecting json. {databag}"
                 log.error(msg)
                 raise DataValidationError(msg) from e
 
             try:
-                return cls.parse_raw(json.dumps(data))  # type: ignore
+                model = cls.parse_obj(data)  # type: ignore
             except pydantic.ValidationError as e:
                 msg = f"failed to validate databag: {databag}"
                 log.debug(msg, exc_info=True)
                 raise DataValidationError(msg) from e
 
+            _memo_store(key, model.copy())
+            return model
+
         def dump(self, databag: Optional[MutableMapping] = None, clear: bool = True):
             """Write the contents of this model to Juju databag.
 
@@ -162,6 +194,11 @@ else:
 
     input_validator = partial(field_validator, mode="before")
 
+    @lru_cache(maxsize=None)
+    def _field_aliases(cls) -> typing.FrozenSet[str]:
+        """Return the databag keys of a model's fields."""
+        return frozenset((f.alias or n) for n, f in cls.model_fields.items())  # type: ignore
+
     class DatabagModel(BaseModel):
         """Base databag model."""
 
@@ -183,25 +220,29 @@ else:
             if nest_under:
                 return cls.model_validate(json.loads(databag[nest_under]))  # type: ignore
 
+            # Don't attempt to parse model-external values
+            key = _memo_key(cls, databag, _field_aliases(cls))
+            if key in _LOAD_MEMO:
+                # a copy, so that callers assigning to its fields do not alter the memo
+                return _LOAD_MEMO[key].model_copy()
+
             try:
-                data = {
-                    k: json.loads(v)
-                    for k, v in databag.items()
-                    # Don't attempt to parse model-external values
-                    if k in {(f.alias or n) for n, f in cls.model_fields.items()}  # type: ignore
-                }
+                data = {k: json.loads(v) for k, v in key[1]}
             except json.JSONDecodeError as e:
                 msg = f"invalid databag contents: expecting json. {databag}"
                 log.error(msg)
                 raise DataValidationError(msg) from e
 
             try:
-                return cls.model_validate_json(json.dumps(data))  # type: ignore
+                model = cls.model_validate(data)  # type: ignore
             except pydantic.ValidationError as e:
                 msg = f"failed to validate databag: {databag}"
                 log.debug(msg, exc_info=True)
                 raise DataValidationError(msg) from e
 
+            _memo_store(key, model.model_copy())
+            return model
+
         def dump(self, databag: Optional[MutableMapping] = None, clear: bool = True):
             """Write the contents of this model to Juju databag.
 
@@ -368,6 +409,8 @@ class _IngressPerAppBase(Object):
         self.relation_name = relation_name
         self.app = self.charm.app
         self.unit = self.charm.unit
+        # Databags parsed in a previous dispatch of this process must not be reused.
+        _LOAD_MEMO.clear()
 
         observe = self.framework.observe
         rel_events = charm.on[relation_name]
@@ -731,7 +774,7 @@ class IngressPerAppRequirer(_IngressPerAppBase):
         self._redirect_https = redirect_https
         self._get_scheme = scheme if callable(scheme) else lambda: scheme
 
-        self._stored.set_default(current_url=None)  # type: ignore
+        self._stored.set_default(current_url=None, skipped_writes=0)  # type: ignore
 
         # if instantiated with a port, and we are related, then
         # we immediately publish our ingress data  to speed up the process.
@@ -830,7 +873,7 @@ class IngressPerAppRequirer(_IngressPerAppBase):
 
         unit_databag = relation.data[self.unit]
         try:
-            IngressRequirerUnitData(host=host, ip=ip).dump(unit_databag)
+            self._dump_if_changed(IngressRequirerUnitData(host=host, ip=ip), unit_databag)
         except pydantic.ValidationError as e:
             msg = "failed to validate unit data"
             log.info(msg, exc_info=True)  # log to INFO because this might be expected
@@ -850,7 +893,7 @@ class IngressPerAppRequirer(_IngressPerAppBase):
             scheme = self._get_scheme()
 
         try:
-            IngressRequirerAppData(  # type: ignore  # pyright does not like aliases
+            app_data = IngressRequirerAppData(  # type: ignore  # pyright does not like aliases
                 model=self.model.name,
                 name=self.app.name,
                 scheme=scheme,
@@ -862,12 +905,37 @@ class IngressPerAppRequirer(_IngressPerAppBase):
                     if self.healthcheck_params
                     else None
                 ),
-            ).dump(app_databag)
+            )
         except pydantic.ValidationError as e:
             msg = "failed to validate app data"
             log.info(msg, exc_info=True)  # log to INFO because this might be expected
             raise DataValidationError(msg) from e
 
+        self._dump_if_changed(app_data, app_databag)
+
+    def _dump_if_changed(self, data: DatabagModel, databag: MutableMapping) -> bool:
+        """Write the model to the databag unless it already holds the same payload.
+
+        Rewriting identical data can still wake up the provider with a
+        relation-changed event, which reconfigures its routes for nothing.
+
+        Returns:
+            True if the databag was written.
+        """
+        payload = data.dump()
+        current = {k: v for k, v in databag.items() if k not in BUILTIN_JUJU_KEYS}
+        if current == payload:
+            self._stored.skipped_writes += 1  # type: ignore
+            return False
+
+        data.dump(databag)
+        return True
+
+    @property
+    def skipped_writes(self) -> int:
+        """Number of databag writes skipped because the data was already published."""
+        return self._stored.skipped_writes  # type: ignore
+
     @property
     def relation(self):
         """The established Relation instance, or None."""
@@ -6,8 +6,13 @@
 
 """Charm definition and helpers."""
 
+import hashlib
+import ipaddress
+import json
 import logging
 import os
+import re
+import time
 
 from charms.nginx_ingress_integrator.v0.nginx_route import require_nginx_route
 from charms.traefik_k8s.v2.ingress import (
@@ -16,14 +21,85 @@ from charms.traefik_k8s.v2.ingress import (
     IngressPerAppRevokedEvent,
 )
 from jinja2 import Environment, FileSystemLoader
+from lightkube.core.exceptions import ApiError
 from ops import Port, main, pebble
-from ops.charm import CharmBase
+from ops.charm import ActionEvent, CharmBase
+from ops.framework import StoredState
 from ops.model import ActiveStatus, BlockedStatus, MaintenanceStatus, WaitingStatus
 from ops.pebble import CheckStatus
 
+from clusters import config_path, extra_clusters, primary_relation
+from drain import probe_latency, wait_for_drain, wait_until_ready
+from health import Health
+from host_facts import HostFacts
 from log import log_event_handler
+from log_forwarding import LOG_LEVELS, log_targets, relation_endpoints
+from no_proxy import no_proxy, target_host
+from pebble_calls import HookBudgetExceededError, PebbleCalls
+from plan_diff import config_diff, normalize_service, plan_diff, preview
+from rollout import Rollout
+from runtime import cgroup_limits, go_runtime_env, validate_go_runtime
 from state import State
+from statefulset import (
+    StatefulSetPatcher,
+    resource_requirements,
+    validate_resources,
+    validate_spread,
+)
+from ui_proxy import (
+    COMPRESSOR_PORT,
+    CONFIG_PATH,
+    METRICS_PORT,
+    METRICS_SCRIPT_PATH,
+    WARMUP_PATH,
+    UiProxy,
+)
 
+# Blue/green slots: each ui-server instance has its own config file and swaps with the other.
+BLUE_GREEN_SERVICES = {"temporal-ui": "temporal-ui-alt", "temporal-ui-alt": "temporal-ui"}
+SERVICE_CONFIG_PATHS = {
+    "temporal-ui": "/home/ui-server/config/charm.yaml",
+    "temporal-ui-alt": "/home/ui-server/config/charm-alt.yaml",
+}
+NGINX_RETRY_ERRORS = {
+    "error",
+    "timeout",
+    "invalid_header",
+    "http_500",
+    "http_502",
+    "http_503",
+    "http_504",
+    "http_403",
+    "http_404",
+    "http_429",
+    "non_idempotent",
+    "off",
+}
+DURATION_PATTERN = re.compile(r"^\d+(ms|s|m|h)$")
+CACHE_SIZE_PATTERN = re.compile(r"^\d+[kmg]?$")
+DEFAULT_FRONTEND_PORT = 7233
+DEBOUNCE_SERVICE = "config-debounce"
+DEBOUNCE_NOTICE = "canonical.com/temporal-ui/config-debounce"
+# Marker file failing the `serving` check, which keeps a unit out of the ingresses.
+WITHDRAWN_MARKER = "/tmp/temporal-ui-withdrawn"  # nosec B108
+SERVING_CHECK = {
+    "override": "replace",
+    "level": "ready",
+    "period": "1s",
+    "threshold": 1,
+    "exec": {"command": f"sh -c 'test ! -e {WITHDRAWN_MARKER}'"},
+}
+SWAP_SERVICE = "swap-timer"
+SWAP_NOTICE = "canonical.com/temporal-ui/swap"
+# Seconds between two readiness probes of the instance a blue/green swap starts.
+SWAP_POLL = 5
+RETIRE_SERVICE = "retire-timer"
+RETIRE_NOTICE = "canonical.com/temporal-ui/retire"
+# Seconds left to the ingresses to act on relation data committed by a hook or
+# on a unit turning not ready, before the connections they stop sending are
+# drained. Covers the `serving` check period and the kubelet readiness probe.
+INGRESS_GRACE = 15
+PROBE_TIMEOUT = 5
 REQUIRED_AUTH_PARAMETERS = ["auth-provider-url", "auth-client-id", "auth-client-secret", "auth-scopes"]
 WORKLOAD_VERSION = "2.27.1"
 
@@ -51,9 +127,12 @@ class TemporalUiK8SOperatorCharm(CharmBase):
 
     Attrs:
         _state: used to store data that is persisted across invocations.
+        _stored: unit-local state that no other unit reads.
         external_hostname: DNS listing used for external connections.
     """
 
+    _stored = StoredState()
+
     @property
     def external_hostname(self):
         """Return the DNS listing used for external connections."""
@@ -68,11 +147,32 @@ class TemporalUiK8SOperatorCharm(CharmBase):
         super().__init__(*args)
         self.name = "temporal-ui"
         self._state = State(self.app, lambda: self.model.get_relation("peer"))
+        # Writing to the peer relation wakes up every other unit, so state only
+        # this unit reads is kept locally.
+        self._stored.set_default(
+            config_pending_since=None,
+            active_service=None,
+            ui_proxy_started=False,
+            log_level=None,
+            withdrawn=False,
+            retiring_service=None,
+            swap_revision=None,
+            swap_started_at=None,
+        )
+        self._rollout = Rollout(self, self._state, lambda: self.model.get_relation("peer"))
+        self._statefulset = StatefulSetPatcher(self.app.name, self.model.name, self.name)
+        self._pebble_calls = PebbleCalls(self.config["hook-time-budget"])
+        self._ui_proxy = UiProxy(self, self._pebble_calls)
+        self._host_facts = HostFacts(self)
+        self._health = Health(self, lambda: self.model.get_relation("peer"))
 
         # Handle basic charm lifecycle.
         self.framework.observe(self.on.peer_relation_changed, self._on_peer_relation_changed)
+        self.framework.observe(self.on.peer_relation_departed, self._on_peer_relation_departed)
+        self.framework.observe(self.on.leader_elected, self._on_leader_elected)
         self.framework.observe(self.on.install, self._on_install)
         self.framework.observe(self.on.temporal_ui_pebble_ready, self._on_temporal_ui_pebble_ready)
+        self.framework.observe(self.on.ui_proxy_pebble_ready, self._on_ui_proxy_pebble_ready)
         self.framework.observe(self.on.config_changed, self._on_config_changed)
 
         # Handle ui:temporal relation.
@@ -80,11 +180,32 @@ class TemporalUiK8SOperatorCharm(CharmBase):
         self.framework.observe(self.on.ui_relation_changed, self._on_ui_relation_changed)
         self.framework.observe(self.on.ui_relation_broken, self._on_ui_relation_broken)
 
+        # Handle logging:loki_push_api relation.
+        self.framework.observe(self.on.logging_relation_changed, self._on_logging_relation_changed)
+        self.framework.observe(self.on.logging_relation_broken, self._on_logging_relation_changed)
+
+        self.framework.observe(self.on.temporal_ui_pebble_check_recovered, self._on_pebble_check)
+        self.framework.observe(self.on.temporal_ui_pebble_check_failed, self._on_pebble_check)
+        self.framework.observe(self.on.temporal_ui_pebble_custom_notice, self._on_pebble_custom_notice)
+
         self.framework.observe(self.on.restart_action, self._on_restart)
+        self.framework.observe(self.on.resume_rollout_action, self._on_resume_rollout)
+        self.framework.observe(self.on.apply_config_action, self._on_apply_config)
+        self.framework.observe(self.on.go_runtime_action, self._on_go_runtime)
+        self.framework.observe(self.on.plan_diff_action, self._on_plan_diff)
+        self.framework.observe(self.on.set_log_level_action, self._on_set_log_level)
+        self.framework.observe(self.on.proxy_bypass_action, self._on_proxy_bypass)
         self.framework.observe(self.on.update_status, self._on_update_status)
 
         # Handle Ingress with Traefik
-        self.ingress = IngressPerAppRequirer(self, port=self.config["port"], strip_prefix=True)
+        self.ingress = IngressPerAppRequirer(
+            self,
+            host=self._ingress_host(),
+            ip=self._ingress_ip(),
+            port=self._published_port,
+            strip_prefix=True,
+            healthcheck_params=self._ingress_healthcheck_params(),
+        )
         self.framework.observe(self.ingress.on.ready, self._on_ingress_ready)
         self.framework.observe(self.ingress.on.revoked, self._on_ingress_revoked)
 
@@ -93,24 +214,109 @@ class TemporalUiK8SOperatorCharm(CharmBase):
 
     def _require_nginx_route(self):
         """Require nginx-route relation based on current configuration."""
+        # The requirer reconciles the relation data from its event observers, so it
+        # must stay referenced; a previous one is released before registering anew.
+        self._nginx_route = None
         if self.model.get_relation("ingress") and self.model.get_relation("nginx-route"):
             self.unit.status = BlockedStatus(
                 "Only one ingress solution is allowed - remove the ingress or the nginx-route relation."
             )
             return
-        require_nginx_route(
+        self._nginx_route = require_nginx_route(
             charm=self,
             service_hostname=self.external_hostname,
             service_name=self.app.name,
-            service_port=self.config["port"],
+            service_port=self._published_port,
             tls_secret_name=self.config["tls-secret-name"],
             backend_protocol="HTTP",
+            session_cookie_max_age=(self.config["session-cookie-max-age"] if self.config["session-affinity"] else None),
+            **self._nginx_route_options(),
         )
 
+    def _ingress_host(self):
+        """Return the host this unit publishes to Traefik.
+
+        Traefik routes to the host and port of every unit on the ingress
+        relation, not to the application's Service, so requests are already
+        balanced across the unit endpoints.
+
+        Returns:
+            The unit's FQDN, or None without an ingress relation.
+        """
+        if not self.model.get_relation("ingress"):
+            return None
+        return self._host_facts.fqdn
+
+    def _ingress_ip(self):
+        """Return the IP this unit publishes to Traefik.
+
+        Returns:
+            The unit's bind address on the ingress relation, or None.
+        """
+        if not self.model.get_relation("ingress"):
+            return None
+        return self._host_facts.bind_address("ingress")
+
+    def _ingress_healthcheck_params(self):
+        """Build the Traefik backend health check from the charm config.
+
+        Returns:
+            The health check parameters, or None when health checks are disabled or invalid.
+        """
+        if not self.config["ingress-healthcheck-path"]:
+            return None
+
+        try:
+            self._validate_ingress_healthcheck()
+        except ValueError:
+            return None
+
+        return {
+            "path": self.config["ingress-healthcheck-path"],
+            "interval": self.config["ingress-healthcheck-interval"],
+            "timeout": self.config["ingress-healthcheck-timeout"],
+        }
+
+    def _validate_ingress_healthcheck(self):
+        """Validate the Traefik backend health check options.
+
+        Raises:
+            ValueError: in case of invalid configuration.
+        """
+        path = self.config["ingress-healthcheck-path"]
+        if path and not path.startswith("/"):
+            raise ValueError("Invalid config: ingress-healthcheck-path must start with /")
+        for option in ("ingress-healthcheck-interval", "ingress-healthcheck-timeout"):
+            if not DURATION_PATTERN.match(self.config[option]):
+                raise ValueError(f"Invalid config: {option} must be a duration such as 10s")
+
+    def _nginx_route_options(self):
+        """Build the optional nginx-route settings from the charm config.
+
+        Returns:
+            Keyword arguments for `require_nginx_route`, empty when the settings are invalid.
+        """
+        try:
+            self._validate_nginx_route()
+        except ValueError:
+            return {}
+
+        return {
+            "limit_rps": self.config["nginx-limit-rps"] or None,
+            "limit_whitelist": self.config["nginx-limit-whitelist"] or None,
+            "max_body_size": self.config["nginx-max-body-size"] or None,
+            "retry_errors": self.config["nginx-retry-errors"] or None,
+            # Access logs are on by default on the nginx-ingress-integrator side.
+            "enable_access_log": None if self.config["nginx-enable-access-log"] else False,
+            "path_routes": self.config["nginx-path-routes"] or None,
+        }
+
     # Event handlers for Traefik ingress
     def _on_ingress_ready(self, event: IngressPerAppReadyEvent):
         """Handle the `IngressPerAppReadyEvent`."""
         logger.info("This app's ingress URL: %s", event.url)
+        if self.config["session-affinity"]:
+            logger.warning("the ingress relation does not support sticky sessions, use nginx-route instead")
 
     def _on_ingress_revoked(self, event: IngressPerAppRevokedEvent):
         """Handle the `IngressPerAppRevokedEvent`."""
@@ -134,6 +340,15 @@ class TemporalUiK8SOperatorCharm(CharmBase):
         """
         self._update(event)
 
+    @log_event_handler(logger)
+    def _on_ui_proxy_pebble_ready(self, event):
+        """Start the asset proxy once its container is ready.
+
+        Args:
+            event: The event triggered when the proxy container is ready.
+        """
+        self._update(event)
+
     @log_event_handler(logger)
     def _on_peer_relation_changed(self, event):
         """Handle peer relation changed event.
@@ -141,8 +356,41 @@ class TemporalUiK8SOperatorCharm(CharmBase):
         Args:
             event: The event triggered when the relation changed.
         """
+        self._rollout.coordinate()
+        self._health.aggregate()
         self._update(event)
 
+    @log_event_handler(logger)
+    def _on_peer_relation_departed(self, event):
+        """Release any rollout slot held by a departed unit.
+
+        Args:
+            event: The event triggered when a peer unit departed.
+        """
+        self._rollout.coordinate()
+        self._health.aggregate()
+
+    @log_event_handler(logger)
+    def _on_leader_elected(self, event):
+        """Take over rollout coordination when elected leader.
+
+        Args:
+            event: The event triggered when this unit became leader.
+        """
+        self._rollout.coordinate()
+        self._reconcile_statefulset()
+
+    @log_event_handler(logger)
+    def _on_pebble_check(self, event):
+        """Report this unit's health to the rollout as soon as the `up` check changes.
+
+        Args:
+            event: The event triggered when a Pebble check failed or recovered.
+        """
+        if event.info.name == "up":
+            self._rollout.report_health(event.info.status == CheckStatus.UP, self._probe_workload)
+            self._health.publish(event.info.status == CheckStatus.UP)
+
     @log_event_handler(logger)
     def _on_config_changed(self, event):
         """Handle configuration changes.
@@ -151,24 +399,354 @@ class TemporalUiK8SOperatorCharm(CharmBase):
             event: The event triggered when the relation changed.
         """
         self.unit.status = WaitingStatus("configuring temporal")
+        if not self._reconcile_statefulset():
+            return
+        if self._debounce(event):
+            return
         self._update(event)
 
+    def _reconcile_statefulset(self):
+        """Apply the pod settings from the charm config to the application's StatefulSet.
+
+        Only the leader patches the StatefulSet; invalid settings are reported by `_validate`.
+
+        Returns:
+            False if the StatefulSet could not be reconciled.
+        """
+        if not self.unit.is_leader():
+            return True
+
+        try:
+            validate_resources(self.config)
+            validate_spread(self.config)
+        except ValueError:
+            return True
+
+        try:
+            if self._statefulset.reconcile(self.config):
+                self.unit.status = MaintenanceStatus("updating pod template")
+        except ApiError as err:
+            if not any(resource_requirements(self.config).values()) and self.config["pod-spread"] == "none":
+                # Nothing to apply: deployments without `juju trust` keep working.
+                logger.warning("cannot read the StatefulSet, skipping pod reconciliation: %s", err)
+                return True
+            logger.error("failed to patch the StatefulSet: %s", err)
+            self.unit.status = BlockedStatus(f"failed to patch the StatefulSet: {err.status.reason}")
+            return False
+        return True
+
+    def _debounce(self, event):
+        """Postpone applying a config change until no other change arrives for a while.
+
+        Every config change restarts a one-shot timer service in the workload
+        container, which emits a Pebble notice once the quiet period is over.
+
+        Args:
+            event: The event triggered when the configuration changed.
+
+        Returns:
+            True if the change was postponed.
+        """
+        debounce = self.config["config-debounce-seconds"]
+        if debounce <= 0:
+            return False
+
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            return False
+
+        try:
+            if self._active_service not in self._pebble_calls.get_plan(container).services:
+                return False
+            self._schedule_notice(
+                container, DEBOUNCE_SERVICE, "config change debounce timer", debounce, DEBOUNCE_NOTICE
+            )
+        except HookBudgetExceededError as err:
+            logger.warning("%s, applying the configuration right away", err)
+            return False
+
+        self._stored.config_pending_since = time.time()
+
+        logger.info("applying configuration after %ds without further changes", debounce)
+        self.unit.status = WaitingStatus(f"applying configuration in {debounce}s")
+        return True
+
+    def _schedule_notice(self, container, service, summary, delay, notice):
+        """Have the workload container emit a Pebble notice after a delay.
+
+        The delay is counted by a one-shot timer service, restarted on every
+        call, so that the charm does not block a hook waiting for it.
+
+        Args:
+            container: application container
+            service: name of the timer service.
+            summary: summary of the timer service.
+            delay: seconds before the notice is emitted.
+            notice: key of the custom notice.
+        """
+        timer = {
+            "override": "replace",
+            "summary": summary,
+            "command": f"sh -c 'sleep {delay} && /charm/bin/pebble notify {notice}'",
+            "startup": "disabled",
+            "on-success": "ignore",
+            "on-failure": "ignore",
+        }
+        self._pebble_calls.add_layer(container, service, {"services": {service: timer}}, combine=True)
+        self._pebble_calls.restart(container, service)
+
+    def _debouncing(self):
+        """Report whether a postponed config change is still within its quiet period.
+
+        Returns:
+            True if the config change must not be applied yet.
+        """
+        pending_since = self._stored.config_pending_since
+        if pending_since is None:
+            return False
+        if time.time() - pending_since < self.config["config-debounce-seconds"]:
+            return True
+        self._stored.config_pending_since = None
+        return False
+
+    @log_event_handler(logger)
+    def _on_pebble_custom_notice(self, event):
+        """Apply postponed config changes, or carry on a swap, once their timer fires.
+
+        Args:
+            event: The event triggered when a Pebble custom notice was recorded.
+        """
+        if event.notice.key == DEBOUNCE_NOTICE:
+            self._update(event)
+        elif event.notice.key == SWAP_NOTICE:
+            self._finish_swap(event)
+        elif event.notice.key == RETIRE_NOTICE:
+            self._retire_previous_service(event)
+
+    @log_event_handler(logger)
+    def _on_apply_config(self, event):
+        """Apply pending config changes immediately, skipping the debounce period.
+
+        Args:
+            event: The event triggered by the apply-config action.
+        """
+        self._stored.config_pending_since = None
+        self._update(event)
+        event.set_results({"result": "configuration applied", "status": self.unit.status.message})
+
     @log_event_handler(logger)
     def _on_restart(self, event):
         """Restart Temporal ui action handler.
 
+        The unit is first marked not ready, so that Kubernetes takes it out of
+        the endpoints the ingresses route to, then drained and restarted. It
+        only becomes ready again once it answers requests; otherwise update-status
+        brings it back once its `up` check passes.
+
         Args:
             event:The event triggered by the restart action
         """
         container = self.unit.get_container(self.name)
         if not container.can_connect():
-            event.defer()
+            event.fail("cannot connect to the workload container")
+            return
+
+        try:
+            self._withdraw(container)
+            self.unit.status = MaintenanceStatus("draining ui")
+            time.sleep(self._within_budget(INGRESS_GRACE))
+            drain_duration = wait_for_drain(self._published_port, self._within_budget(self.config["drain-timeout"]))
+
+            self.unit.status = MaintenanceStatus("restarting ui")
+            self._pebble_calls.restart(container, self._active_service)
+            self._health.record_restart()
+            time_to_ready = wait_until_ready(
+                f"http://localhost:{self._published_port}/",
+                self._within_budget(self.config["rollout-health-timeout"]),
+            )
+            self._rejoin(container)
+        except HookBudgetExceededError as err:
+            event.fail(str(err))
+            return
+        except TimeoutError as err:
+            logger.error("%s, keeping the unit out of the ingress", err)
+            self.unit.status = BlockedStatus("ui not ready after restart, kept out of the ingress")
+            event.fail(str(err))
+            return
+
+        event.set_results(
+            {
+                "result": "worker successfully restarted",
+                "drain-duration": f"{drain_duration:.1f}s",
+                "time-to-ready": f"{time_to_ready:.1f}s",
+            }
+        )
+
+    def _within_budget(self, timeout):
+        """Bound a wait by what is left of the hook time budget.
+
+        Args:
+            timeout: seconds the wait may last at most.
+
+        Returns:
+            The seconds the wait may last in this hook.
+        """
+        return max(min(timeout, self._pebble_calls.remaining), 0)
+
+    def _withdraw(self, container):
+        """Mark this unit not ready, so that the ingresses stop routing to it.
+
+        The relation data is left untouched: ingress providers reject the whole
+        relation if a unit's databag lacks its address.
+
+        Args:
+            container: application container
+        """
+        self._pebble_calls.push(container, WITHDRAWN_MARKER, "", make_dirs=True)
+        self._stored.withdrawn = True
+        self._publish_health(False)
+
+    def _rejoin(self, container):
+        """Mark a withdrawn unit ready again.
+
+        Args:
+            container: application container
+        """
+        self._pebble_calls.remove_path(container, WITHDRAWN_MARKER)
+        self._stored.withdrawn = False
+        self._publish_health(True)
+        self._set_active_status()
+
+    def _publish_ingress(self):
+        """Publish this unit's address to the Traefik ingress relation."""
+        self.ingress.provide_ingress_requirements(
+            host=self._ingress_host(), ip=self._ingress_ip(), port=self._published_port
+        )
+
+    @log_event_handler(logger)
+    def _on_resume_rollout(self, event):
+        """Resume a rollout paused by a failed unit.
+
+        Args:
+            event: The event triggered by the resume-rollout action.
+        """
+        if not self.unit.is_leader():
+            event.fail("the rollout can only be resumed on the leader unit")
+            return
+
+        if not self._state.is_ready():
+            event.fail("peer relation not ready")
+            return
+
+        self._rollout.resume()
+        event.set_results({"result": "rollout resumed", "rollout": json.dumps(self._rollout.status["lock"])})
+
+    @log_event_handler(logger)
+    def _on_go_runtime(self, event):
+        """Report the container limits and the Go runtime settings derived from them.
+
+        Args:
+            event: The event triggered by the go-runtime action.
+        """
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            event.fail("cannot connect to the temporal-ui container")
+            return
+
+        try:
+            cpus, memory = cgroup_limits(self._pebble_calls, container)
+            env = go_runtime_env(self._pebble_calls, container, self.config)
+        except HookBudgetExceededError as err:
+            event.fail(str(err))
+            return
+
+        results = {
+            "cpu-limit": "unlimited" if cpus is None else f"{cpus:g}",
+            "memory-limit": "unlimited" if memory is None else str(memory),
+        }
+        results.update({key.lower(): env.get(key, "default") for key in ("GOMAXPROCS", "GOMEMLIMIT", "GOGC")})
+        event.set_results(results)
+
+    @log_event_handler(logger)
+    def _on_set_log_level(self, event):
+        """Override the log level of this unit only, or go back to the log-level config.
+
+        Args:
+            event: The event triggered by the set-log-level action.
+        """
+        level = event.params.get("level")
+        if level is not None and level not in LOG_LEVELS:
+            event.fail(f"level must be one of {', '.join(LOG_LEVELS)}")
+            return
+
+        self._stored.log_level = level
+        self._update(event)
+        event.set_results({"log-level": self._log_level, "status": self.unit.status.message})
+
+    @property
+    def _log_level(self):
+        """Return the log level of this unit's ui-server, with its override if any."""
+        return self._stored.log_level or self.config["log-level"]
+
+    @log_event_handler(logger)
+    def _on_proxy_bypass(self, event):
+        """Show the destinations ui-server reaches without the HTTP proxy.
+
+        Args:
+            event: The event triggered by the proxy-bypass action.
+        """
+        proxied = os.environ.get("JUJU_CHARM_HTTP_PROXY") or os.environ.get("JUJU_CHARM_HTTPS_PROXY")
+        event.set_results(
+            {
+                "no-proxy": ",".join(self._no_proxy()),
+                "applied": "yes" if proxied else "no, the model has no HTTP proxy configured",
+            }
+        )
+
+    @log_event_handler(logger)
+    def _on_plan_diff(self, event):
+        """Show what applying the current configuration would change, without applying it.
+
+        Args:
+            event: The event triggered by the plan-diff action.
+        """
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            event.fail("cannot connect to the temporal-ui container")
+            return
+
+        try:
+            self._validate()
+        except ValueError as err:
+            event.fail(str(err))
             return
 
-        self.unit.status = MaintenanceStatus("restarting ui")
-        container.restart(self.name)
+        _, _, configs, pebble_layer = self._desired_configuration(container)
+        diffs = {path: config_diff(path, self._read_file(container, path), config) for path, config in configs.items()}
+        running = {name for name, service in container.get_services().items() if service.is_running()}
+        event.set_results(
+            preview(
+                {path: diff for path, diff in diffs.items() if diff},
+                plan_diff(container.get_plan(), pebble_layer),
+                running,
+                blue_green=self.config["blue-green-enabled"],
+            )
+        )
 
-        event.set_results({"result": "worker successfully restarted"})
+    def _read_file(self, container, path):
+        """Read a file from a container.
+
+        Args:
+            container: the container.
+            path: path of the file.
+
+        Returns:
+            The file contents, or None if it does not exist.
+        """
+        try:
+            return container.pull(path).read()
+        except pebble.PathError:
+            return None
 
     @log_event_handler(logger)
     def _on_update_status(self, event):
@@ -182,21 +760,77 @@ class TemporalUiK8SOperatorCharm(CharmBase):
         except ValueError:
             return
 
+        if self._stored.config_pending_since is not None and not self._debouncing():
+            self._update(event)
+            return
+
         container = self.unit.get_container(self.name)
         valid_pebble_plan = self._validate_pebble_plan(container)
         if not valid_pebble_plan:
             self._update(event)
             return
 
-        check = container.get_check("up")
+        self._finish_swap(event)
+        self._retire_previous_service(event)
+        try:
+            check = self._pebble_calls.get_check(container, "up")
+        except HookBudgetExceededError as err:
+            logger.warning("%s, skipping the status check", err)
+            return
+
+        if self._stored.withdrawn:
+            self._rejoin_when_up(container, check.status == CheckStatus.UP)
+            return
+
+        self._rollout.report_health(check.status == CheckStatus.UP, self._probe_workload)
+        self._publish_health(check.status == CheckStatus.UP)
         if check.status != CheckStatus.UP:
             self.unit.status = MaintenanceStatus("Status check: DOWN")
             return
 
+        self._set_active_status()
+
+    def _rejoin_when_up(self, container, up):
+        """Mark a unit left withdrawn by a restart ready again once its `up` check passes.
+
+        Args:
+            container: application container
+            up: whether the workload `up` check passes.
+        """
+        if not up:
+            return
+        try:
+            self._rejoin(container)
+        except HookBudgetExceededError as err:
+            logger.warning("%s, the unit stays withdrawn", err)
+
+    def _set_active_status(self):
+        """Report the workload as active."""
         self.unit.set_workload_version(WORKLOAD_VERSION)
         message = "auth enabled" if self.config["auth-enabled"] else ""
         self.unit.status = ActiveStatus(message)
 
+    def _probe_workload(self):
+        """Send a request to the ui-server instance receiving traffic.
+
+        Returns:
+            True if it answered.
+        """
+        url = f"http://localhost:{self._service_port(self._active_service)}/"
+        return probe_latency(url, PROBE_TIMEOUT) is not None
+
+    def _publish_health(self, up):
+        """Probe the workload and share its health with the other units.
+
+        Args:
+            up: whether the workload `up` check passes.
+        """
+        latency = None
+        if up:
+            latency = probe_latency(f"http://localhost:{self._service_port(self._active_service)}/", PROBE_TIMEOUT)
+        self._health.publish(up, latency)
+        self._health.aggregate()
+
     def _validate_pebble_plan(self, container):
         """Validate Temporal UI pebble plan.
 
@@ -207,11 +841,41 @@ class TemporalUiK8SOperatorCharm(CharmBase):
             bool of pebble plan validity
         """
         try:
-            plan = container.get_plan().to_dict()
-            return bool(plan["services"][self.name]["on-check-failure"])
-        except (KeyError, pebble.ConnectionError):
+            plan = self._pebble_calls.get_plan(container).to_dict()
+            return bool(plan["services"][self._active_service]["on-check-failure"])
+        except (KeyError, HookBudgetExceededError):
+            return False
+
+    def _layer_changed(self, container, pebble_layer):
+        """Report whether applying the layer would restart any running workload.
+
+        Args:
+            container: application container
+            pebble_layer: layer about to be added.
+
+        Returns:
+            True if any service of the layer is already planned and its definition differs.
+        """
+        return any(self._service_changed(container, service, pebble_layer) for service in pebble_layer["services"])
+
+    def _service_changed(self, container, service, pebble_layer):
+        """Report whether applying the layer would restart a running workload.
+
+        Args:
+            container: application container
+            service: name of the Pebble service defined by the layer.
+            pebble_layer: layer about to be added.
+
+        Returns:
+            True if the service is already planned and its definition differs.
+        """
+        current = self._pebble_calls.get_plan(container).services.get(service)
+        if current is None:
             return False
 
+        desired = pebble.Layer(pebble_layer).services[service]
+        return normalize_service(current.to_dict()) != normalize_service(desired.to_dict())
+
     @log_event_handler(logger)
     def _on_ui_relation_joined(self, event):
         """Handle joining a ui:temporal relation.
@@ -225,7 +889,7 @@ class TemporalUiK8SOperatorCharm(CharmBase):
 
         self.unit.status = WaitingStatus(f"handling {event.relation.name} change")
         if self.unit.is_leader():
-            self._state.server_status = event.relation.data[event.app].get("server_status")
+            self._sync_server_status()
 
         self._update(event)
 
@@ -241,7 +905,7 @@ class TemporalUiK8SOperatorCharm(CharmBase):
             return
 
         if self.unit.is_leader():
-            self._state.server_status = event.relation.data[event.app].get("server_status")
+            self._sync_server_status()
 
         logger.debug(f"ui:temporal: server is {self._state.server_status}")
         self._update(event)
@@ -259,10 +923,31 @@ class TemporalUiK8SOperatorCharm(CharmBase):
 
         self.unit.status = WaitingStatus(f"handling {event.relation.name} removal")
         if self.unit.is_leader():
-            self._state.server_status = "blocked"
+            self._sync_server_status(exclude=event.relation)
 
         self._update(event)
 
+    @log_event_handler(logger)
+    def _on_logging_relation_changed(self, event):
+        """Point the log targets at the Loki endpoints of the logging relations.
+
+        Args:
+            event: The event triggered when the relation changed or was removed.
+        """
+        self._update(event)
+
+    def _sync_server_status(self, exclude=None):
+        """Record the status of the Temporal server behind the primary ui relation.
+
+        Args:
+            exclude: relation being removed, if any.
+        """
+        primary = primary_relation([r for r in self.model.relations["ui"] if r != exclude])
+        if primary is None or primary.app is None:
+            self._state.server_status = "blocked"
+            return
+        self._state.server_status = primary.data[primary.app].get("server_status")
+
     def _validate(self):
         """Validate that configuration and relations are valid and ready.
 
@@ -278,6 +963,17 @@ class TemporalUiK8SOperatorCharm(CharmBase):
         if not self._state.server_status == "ready":
             raise ValueError("ui:temporal relation: server is not ready")
 
+        if self.config["frontend-load-balancing"] not in ("none", "round-robin"):
+            raise ValueError("Invalid config: frontend-load-balancing must be one of none or round-robin")
+
+        self._validate_rollout()
+        self._validate_ingress()
+        self._validate_clusters()
+        self._validate_ui_server()
+        validate_go_runtime(self.config)
+        validate_resources(self.config)
+        validate_spread(self.config)
+
         if self.config["auth-enabled"]:
             for param in REQUIRED_AUTH_PARAMETERS:
                 if self.config[param].strip() == "":
@@ -286,6 +982,119 @@ class TemporalUiK8SOperatorCharm(CharmBase):
             if not self.model.relations.get("nginx-route"):
                 raise ValueError("Invalid config: auth cannot work without ingress relation")
 
+    def _validate_ingress(self):
+        """Validate the options controlling how traffic reaches the units.
+
+        Raises:
+            ValueError: in case of invalid configuration.
+        """
+        if self.config["session-affinity"] and self.config["session-cookie-max-age"] < 1:
+            raise ValueError("Invalid config: session-cookie-max-age must be positive")
+
+        self._validate_ingress_healthcheck()
+        self._validate_nginx_route()
+
+        if self._ui_proxy_enabled:
+            ports = (self.config["port"], self.config["blue-green-port"], COMPRESSOR_PORT, METRICS_PORT)
+            if self.config["asset-proxy-port"] in ports:
+                raise ValueError("Invalid config: asset-proxy-port conflicts with another port")
+            if not CACHE_SIZE_PATTERN.match(self.config["asset-cache-size"]):
+                raise ValueError("Invalid config: asset-cache-size must be a size such as 256m")
+            if self.config["api-cache-ttl"] < 1:
+                raise ValueError("Invalid config: api-cache-ttl must be at least 1")
+
+    def _validate_nginx_route(self):
+        """Validate the options passed to the nginx-route relation.
+
+        Raises:
+            ValueError: in case of invalid configuration.
+        """
+        for option in ("nginx-limit-rps", "nginx-max-body-size"):
+            if self.config[option] < 0:
+                raise ValueError(f"Invalid config: {option} must not be negative")
+
+        for network in filter(None, self.config["nginx-limit-whitelist"].split(",")):
+            try:
+                ipaddress.ip_network(network.strip(), strict=False)
+            except ValueError as err:
+                raise ValueError(f"Invalid config: nginx-limit-whitelist entry {network!r} is not a CIDR") from err
+
+        for error in filter(None, self.config["nginx-retry-errors"].split(",")):
+            if error.strip() not in NGINX_RETRY_ERRORS:
+                raise ValueError(f"Invalid config: nginx-retry-errors entry {error!r} is not supported")
+
+        for path in filter(None, self.config["nginx-path-routes"].split(",")):
+            if not path.strip().startswith("/"):
+                raise ValueError(f"Invalid config: nginx-path-routes entry {path!r} must start with /")
+
+    def _validate_rollout(self):
+        """Validate the options controlling how changes are rolled out.
+
+        Raises:
+            ValueError: in case of invalid configuration.
+        """
+        if self.config["rollout-batch-size"] < 1:
+            raise ValueError("Invalid config: rollout-batch-size must be at least 1")
+
+        if self.config["blue-green-enabled"]:
+            if self.config["blue-green-port"] == self.config["port"]:
+                raise ValueError("Invalid config: blue-green-port must differ from port")
+            if self.app.planned_units() > 1:
+                raise ValueError("Invalid config: blue-green-enabled requires a single unit")
+            if len(self.model.relations["ui"]) > 1:
+                raise ValueError("Invalid config: blue-green-enabled requires a single ui relation")
+
+    def _validate_ui_server(self):
+        """Validate the ui-server settings controlling background polling and outbound calls.
+
+        Raises:
+            ValueError: in case of invalid configuration.
+        """
+        if not DURATION_PATTERN.match(self.config["refresh-interval"]):
+            raise ValueError("Invalid config: refresh-interval must be a duration such as 1m")
+
+        if self.config["notify-on-new-version"] not in ("auto", "true", "false"):
+            raise ValueError("Invalid config: notify-on-new-version must be one of auto, true or false")
+
+        for network in filter(None, self.config["no-proxy-cidrs"].split(",")):
+            try:
+                ipaddress.ip_network(network.strip(), strict=False)
+            except ValueError as err:
+                raise ValueError(f"Invalid config: no-proxy-cidrs entry {network!r} is not a CIDR") from err
+
+    def _notify_on_new_version(self):
+        """Decide whether ui-server checks for new Temporal versions.
+
+        In auto mode, the check is only enabled when the model has an HTTP
+        proxy: without one, the unit is assumed to have no egress and the
+        check would only stall until it times out.
+
+        Returns:
+            True if new version notifications are enabled.
+        """
+        setting = self.config["notify-on-new-version"]
+        if setting == "auto":
+            return bool(os.environ.get("JUJU_CHARM_HTTP_PROXY") or os.environ.get("JUJU_CHARM_HTTPS_PROXY"))
+        return setting == "true"
+
+    def _validate_clusters(self):
+        """Validate the ports of the ui-server instances serving additional clusters.
+
+        Raises:
+            ValueError: in case of invalid configuration.
+        """
+        start = self.config["cluster-port-start"]
+        ports = range(start, start + len(self.model.relations["ui"]) - 1)
+        taken = (
+            self.config["port"],
+            self.config["blue-green-port"],
+            self.config["asset-proxy-port"],
+            COMPRESSOR_PORT,
+            METRICS_PORT,
+        )
+        if any(port in ports for port in taken):
+            raise ValueError("Invalid config: cluster-port-start range conflicts with another port")
+
     @log_event_handler(logger)
     def _update(self, event):
         """Update the Temporal UI configuration and replan its execution.
@@ -304,9 +1113,124 @@ class TemporalUiK8SOperatorCharm(CharmBase):
             event.defer()
             return
 
+        if self._debouncing():
+            logger.info("config change pending, waiting for the debounce period to end")
+            return
+
+        try:
+            self._configure(container)
+        except HookBudgetExceededError as err:
+            logger.warning("deferring the configuration of temporal ui: %s", err)
+            self.unit.status = WaitingStatus("hook time budget exhausted, retrying")
+            if not isinstance(event, ActionEvent):
+                event.defer()
+
+    def _configure(self, container):
+        """Render the Temporal UI configuration and roll it out.
+
+        Args:
+            container: application container
+        """
         logger.info("configuring temporal ui")
+        service, context, configs, pebble_layer = self._desired_configuration(container)
+
+        revision = None
+        if self._layer_changed(container, pebble_layer):
+            revision = hashlib.sha256(json.dumps([configs, pebble_layer], sort_keys=True).encode()).hexdigest()[:12]
+            if not self._rollout.acquire(revision):
+                logger.info("waiting for the rollout lock to apply %s", revision)
+                self.unit.status = WaitingStatus("waiting for rollout lock")
+                return
+
+            if self.config["blue-green-enabled"]:
+                self._swap(container, context, revision)
+                return
+
+        self._apply(container, service, configs, pebble_layer)
+
+        if revision:
+            self._rollout.applied(revision)
+            self._health.record_restart()
+
+        self.unit.status = MaintenanceStatus("replanning application")
+
+    def _desired_configuration(self, container):
+        """Render the ui-server configurations and the Pebble layer running them.
+
+        Args:
+            container: application container
+
+        Returns:
+            A tuple of the name of the primary instance's Pebble service, the
+            environment it is rendered from, the mapping of config file paths
+            to their contents and the Pebble layer dict.
+        """
+        context = self._workload_context()
+        context.update(go_runtime_env(self._pebble_calls, container, self.config))
+
+        service = self._active_service if self.config["blue-green-enabled"] else self.name
+        context["TEMPORAL_UI_PORT"] = self._service_port(service)
+        configs = {SERVICE_CONFIG_PATHS[service]: render("config.jinja", context)}
+        pebble_layer = self._pebble_layer(service, context)
+        self._add_extra_clusters(context, configs, pebble_layer)
+        return service, context, configs, pebble_layer
+
+    def _apply(self, container, service, configs, pebble_layer):
+        """Push the ui-server configurations, replan them and route traffic to them.
+
+        Args:
+            container: application container
+            service: name of the Pebble service of the primary instance.
+            configs: mapping of config file paths to their contents.
+            pebble_layer: Pebble layer running all the ui-server instances.
+        """
+        for path, config in configs.items():
+            self._pebble_calls.push(container, path, config, make_dirs=True)
+
+        logger.info("planning temporal ui execution")
+        self._pebble_calls.add_layer(container, self.name, pebble_layer, combine=True)
+        self._retire_stale_clusters(container, pebble_layer)
+        self._pebble_calls.replan(container)
+        self._forward_logs(container)
+        self._update_ui_proxy(self._service_port(service))
+
+        if service != self._active_service:
+            self._retire_service(container, self._active_service)
+        self._open_published_port()
+
+    def _forward_logs(self, container):
+        """Point the Pebble log targets of the ui-server instances at the Loki endpoints.
+
+        Args:
+            container: application container
+        """
+        plan = self._pebble_calls.get_plan(container)
+        services = [name for name in plan.services if name == self.name or name.startswith(f"{self.name}-")]
+        endpoints = [url for relation in self.model.relations["logging"] for url in relation_endpoints(relation)]
+        if self.config["loki-endpoint"]:
+            endpoints.append(self.config["loki-endpoint"])
+
+        labels = {
+            "juju_model": self.model.name,
+            "juju_model_uuid": self.model.uuid,
+            "juju_application": self.app.name,
+            "juju_unit": self.unit.name,
+            "juju_charm": self.meta.name,
+        }
+        targets = log_targets(sorted(set(endpoints)), services, labels, plan.log_targets)
+        current = {name: target.to_dict() for name, target in plan.log_targets.items()}
+        changed = {name: target for name, target in targets.items() if current.get(name) != target}
+        if changed:
+            logger.info("updating log targets %s", ", ".join(sorted(changed)))
+            self._pebble_calls.add_layer(container, self.name, {"log-targets": changed}, combine=True)
+
+    def _workload_context(self):
+        """Build the environment used to render the ui-server configuration.
+
+        Returns:
+            A dict of environment variables.
+        """
         options = {
-            "log-level": "LOG_LEVEL",
             "port": "TEMPORAL_UI_PORT",
             "default-namespace": "TEMPORAL_DEFAULT_NAMESPACE",
             "auth-enabled": "TEMPORAL_AUTH_ENABLED",
@@ -318,9 +1242,13 @@ class TemporalUiK8SOperatorCharm(CharmBase):
             "workflow-reset-disabled": "TEMPORAL_WORKFLOW_RESET_DISABLED",
             "batch-actions-disabled": "TEMPORAL_BATCH_ACTIONS_DISABLED",
             "hide-workflow-query-errors": "TEMPORAL_HIDE_WORKFLOW_QUERY_ERRORS",
+            "refresh-interval": "TEMPORAL_REFRESH_INTERVAL",
         }
 
         context = {config_key: self.config[key] for key, config_key in options.items()}
+        context["LOG_LEVEL"] = self._log_level
+        context["TEMPORAL_NOTIFY_ON_NEW_VERSION"] = self._notify_on_new_version()
+        context["TEMPORAL_ADDRESS"] = self._frontend_address(primary_relation(self.model.relations["ui"]))
         if self.config["auth-enabled"]:
             auth_options = {
                 "auth-provider-url": "TEMPORAL_AUTH_PROVIDER_URL",
@@ -335,27 +1263,133 @@ class TemporalUiK8SOperatorCharm(CharmBase):
 
         http_proxy = os.environ.get("JUJU_CHARM_HTTP_PROXY")
         https_proxy = os.environ.get("JUJU_CHARM_HTTPS_PROXY")
-        no_proxy = os.environ.get("JUJU_CHARM_NO_PROXY")
 
         if http_proxy or https_proxy:
             context.update(
                 {
                     "HTTP_PROXY": http_proxy,
                     "HTTPS_PROXY": https_proxy,
-                    "NO_PROXY": no_proxy,
+                    "NO_PROXY": ",".join(self._no_proxy()),
                 }
             )
 
-        config = render("config.jinja", context)
-        container.push("/home/ui-server/config/charm.yaml", config, make_dirs=True)
+        return context
 
-        logger.info("planning temporal ui execution")
-        pebble_layer = {
+    def _no_proxy(self):
+        """Build the list of destinations ui-server reaches without the HTTP proxy.
+
+        The model's NO_PROXY list is extended with the Temporal frontends, the
+        codec server, in-cluster service names and the pod and service networks,
+        so that in-cluster traffic does not detour through the proxy.
+
+        Returns:
+            The list of NO_PROXY entries.
+        """
+        hosts = [target_host(self._frontend_address(relation)) for relation in self.model.relations["ui"]]
+        hosts.append(target_host(self.config["codec-endpoint"]))
+        cidrs = [*(self._host_facts.subnets("peer") or []), *self.config["no-proxy-cidrs"].split(",")]
+        return no_proxy(os.environ.get("JUJU_CHARM_NO_PROXY"), filter(None, hosts), cidrs)
+
+    @property
+    def _primary_relation(self):
+        """Return the ui relation served by the main ui-server instance."""
+        return primary_relation(self.model.relations["ui"])
+
+    def _ready_clusters(self):
+        """Return the additional clusters whose Temporal server is ready.
+
+        Returns:
+            A list of cluster descriptions from `extra_clusters`.
+        """
+        clusters = extra_clusters(self.model.relations["ui"], self.config["cluster-port-start"])
+        return [cluster for cluster in clusters if cluster["ready"]]
+
+    def _add_extra_clusters(self, context, configs, pebble_layer):
+        """Add a ui-server instance for each additional cluster to the configs and layer.
+
+        Args:
+            context: environment used to render the primary ui-server configuration.
+            configs: mapping of config file paths to their contents, updated in place.
+            pebble_layer: Pebble layer dict, updated in place.
+        """
+        for cluster in self._ready_clusters():
+            cluster_context = {
+                **context,
+                "TEMPORAL_ADDRESS": self._frontend_address(cluster["relation"]),
+                "TEMPORAL_UI_PORT": cluster["port"],
+                "TEMPORAL_UI_PUBLIC_PATH": cluster["path"],
+            }
+            if self.config["auth-enabled"]:
+                cluster_context[
+                    "TEMPORAL_AUTH_CALLBACK_URL"
+                ] = f"https://{self.config['external-hostname']}{cluster['path']}/auth/sso/callback"
+
+            configs[config_path(cluster)] = render("config.jinja", cluster_context)
+            pebble_layer["services"][cluster["service"]] = {
+                "summary": f"temporal ui for {cluster['relation'].app.name}",
+                "command": f"./ui-server --env {cluster['env']} start",
+                "startup": "enabled",
+                "override": "replace",
+                "environment": cluster_context,
+            }
+
+    def _retire_stale_clusters(self, container, pebble_layer):
+        """Retire the ui-server instances of clusters that are no longer served.
+
+        Args:
+            container: application container
+            pebble_layer: Pebble layer dict with the services to keep.
+        """
+        for name, service in self._pebble_calls.get_plan(container).services.items():
+            if name in BLUE_GREEN_SERVICES or name in pebble_layer["services"]:
+                continue
+            if name.startswith(f"{self.name}-") and service.startup != "disabled":
+                logger.info("retiring %s", name)
+                self._retire_service(container, name)
+
+    def _frontend_address(self, relation):
+        """Return the gRPC target of the Temporal frontend behind a ui relation.
+
+        The address published by the server on the relation is used unless
+        overridden in the config for the primary cluster, and defaults to the server application's
+        service. In round-robin mode, a `dns:///` target makes the gRPC client
+        resolve every address behind the name, such as all the pods behind a
+        headless service, instead of a single service VIP. ui-server dials with
+        a default service config selecting the round_robin policy, so nothing
+        else is needed for requests to be balanced across those addresses.
+
+        Args:
+            relation: the ui:temporal relation.
+
+        Returns:
+            The frontend gRPC target.
+        """
+        address = self.config["frontend-address"] if relation == self._primary_relation else ""
+        if not address and relation and relation.app:
+            address = relation.data[relation.app].get("frontend_address")
+            address = address or f"{relation.app.name}:{DEFAULT_FRONTEND_PORT}"
+
+        if self.config["frontend-load-balancing"] == "round-robin" and "://" not in address:
+            address = f"dns:///{address}"
+        return address
+
+    def _pebble_layer(self, service, context):
+        """Build the Pebble layer running the given ui-server instance.
+
+        Args:
+            service: name of the Pebble service.
+            context: environment used to render the ui-server configuration.
+
+        Returns:
+            The Pebble layer dict.
+        """
+        env = os.path.splitext(os.path.basename(SERVICE_CONFIG_PATHS[service]))[0]
+        return {
             "summary": "temporal server layer",
             "services": {
-                self.name: {
+                service: {
                     "summary": "temporal ui",
-                    "command": "./ui-server --env charm start",
+                    "command": f"./ui-server --env {env} start",
                     "startup": "enabled",
                     "override": "replace",
                     # Including config values here so that a change in the
@@ -364,21 +1398,271 @@ class TemporalUiK8SOperatorCharm(CharmBase):
                     "on-check-failure": {"up": "ignore"},
                 }
             },
-            "checks": {
-                "up": {
-                    "override": "replace",
-                    "period": "10s",
-                    "http": {"url": f"http://localhost:{self.config['port']}/"},
-                }
-            },
+            "checks": {"up": self._up_check(service), "serving": SERVING_CHECK},
+        }
+
+    def _up_check(self, service):
+        """Build the Pebble check probing the given ui-server instance.
+
+        With session affinity, the check is readiness-level: a failing unit
+        is reported not ready to Kubernetes and leaves the Service endpoints,
+        so sticky sessions pinned to it move to a healthy unit.
+
+        Args:
+            service: name of the Pebble service.
+
+        Returns:
+            The check definition.
+        """
+        check = {
+            "override": "replace",
+            "period": "10s",
+            "http": {"url": f"http://localhost:{self._service_port(service)}/"},
         }
+        if self.config["session-affinity"]:
+            check["level"] = "ready"
+        return check
+
+    def _swap(self, container, context, revision):
+        """Start the new configuration next to the running one.
+
+        Traffic is only switched by a later hook, once the new instance is
+        ready, so that the hook does not block waiting for it.
+
+        Args:
+            container: application container
+            context: environment used to render the ui-server configuration.
+            revision: hash identifying the change being rolled out.
+        """
+        active = self._active_service
+        standby = BLUE_GREEN_SERVICES[active]
+        if self._stored.swap_revision == revision:
+            self.unit.status = MaintenanceStatus(f"waiting for {standby} to be ready")
+            return
+
+        port = self._service_port(standby)
+        logger.info("starting %s on port %d", standby, port)
+        if self._stored.retiring_service == standby:
+            # The previous instance is replaced before it was retired.
+            self._stored.retiring_service = None
+
+        context = {**context, "TEMPORAL_UI_PORT": port}
+        self._pebble_calls.push(
+            container, SERVICE_CONFIG_PATHS[standby], render("config.jinja", context), make_dirs=True
+        )
+        standby_layer = self._pebble_layer(standby, context)
+        self._pebble_calls.add_layer(container, self.name, {"services": standby_layer["services"]}, combine=True)
+        self._pebble_calls.restart(container, standby)
+
+        self._stored.swap_revision = revision
+        self._stored.swap_started_at = time.time()
+        self._schedule_notice(container, SWAP_SERVICE, "blue/green swap timer", SWAP_POLL, SWAP_NOTICE)
+        self.unit.status = MaintenanceStatus(f"waiting for {standby} to be ready")
+
+    def _finish_swap(self, event):
+        """Switch traffic to the instance started by a swap once it is ready.
+
+        The instance is probed once per hook, and given up on after
+        `rollout-health-timeout` seconds.
+
+        Args:
+            event: The event carrying on the swap.
+        """
+        revision = self._stored.swap_revision
+        if revision is None:
+            return
+
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            return
 
-        container.add_layer(self.name, pebble_layer, combine=True)
-        self.unit.set_ports(Port(protocol="tcp", port=self.config["port"]))
-        container.replan()
+        active = self._active_service
+        standby = BLUE_GREEN_SERVICES[active]
+        port = self._service_port(standby)
+        try:
+            if not self.config["blue-green-enabled"]:
+                # Blue/green was disabled and the change applied in place.
+                self._pebble_calls.stop(container, standby)
+                self._clear_swap()
+                return
+
+            if probe_latency(f"http://localhost:{port}/", PROBE_TIMEOUT) is None:
+                if time.time() - self._stored.swap_started_at < self.config["rollout-health-timeout"]:
+                    self._schedule_notice(container, SWAP_SERVICE, "blue/green swap timer", SWAP_POLL, SWAP_NOTICE)
+                    return
+                logger.error("blue/green swap failed: %s not ready on port %d", standby, port)
+                self._pebble_calls.stop(container, standby)
+                self._clear_swap()
+                self._rollout.failed(revision)
+                self.unit.status = BlockedStatus(f"blue/green swap failed: {standby} not ready")
+                return
+
+            logger.info("switching traffic from %s to %s", active, standby)
+            self._stored.active_service = standby
+            self._clear_swap()
+            self._update_ui_proxy(port)
+            self._publish_port(self._published_port)
+
+            # The new port only reaches the ingresses once this hook ends, so the
+            # previous instance keeps serving until a later hook retires it.
+            self._stored.retiring_service = active
+            self._schedule_notice(container, RETIRE_SERVICE, "blue/green retire timer", INGRESS_GRACE, RETIRE_NOTICE)
+            self._pebble_calls.add_layer(
+                container, self.name, {"checks": {"up": self._up_check(standby)}}, combine=True
+            )
+            self._forward_logs(container)
+        except HookBudgetExceededError as err:
+            logger.warning("%s, retrying to carry on the swap", err)
+            event.defer()
+            return
 
+        self._rollout.applied(revision)
         self.unit.status = MaintenanceStatus("replanning application")
 
+    def _clear_swap(self):
+        """Forget the swap in progress."""
+        self._stored.swap_revision = None
+        self._stored.swap_started_at = None
+
+    def _retire_previous_service(self, event):
+        """Drain and retire the instance a blue/green swap moved traffic away from.
+
+        Only runs once the port published by the swap is the one opened, so
+        that the ingresses were told about the new instance before the previous
+        one stops.
+
+        Args:
+            event: The event retiring the instance.
+        """
+        service = self._stored.retiring_service
+        if service == self._active_service:
+            # Blue/green was disabled and traffic moved back to this instance.
+            self._stored.retiring_service = service = None
+        if service is None or self.unit.opened_ports() != {Port(protocol="tcp", port=self._published_port)}:
+            return
+
+        container = self.unit.get_container(self.name)
+        if not container.can_connect():
+            return
+
+        drain_duration = wait_for_drain(self._service_port(service), self.config["drain-timeout"])
+        try:
+            self._retire_service(container, service)
+        except HookBudgetExceededError as err:
+            logger.warning("%s, retrying to retire %s", err, service)
+            event.defer()
+            return
+        logger.info("retired %s after draining it for %.1fs", service, drain_duration)
+        self._stored.retiring_service = None
+
+    def _open_published_port(self):
+        """Open the port receiving traffic, and repoint the ingresses if it moved."""
+        port = Port(protocol="tcp", port=self._published_port)
+        opened = self.unit.opened_ports()
+        if opened and opened != {port}:
+            self._publish_port(port.port)
+        else:
+            self.unit.set_ports(port)
+
+    def _publish_port(self, port):
+        """Point the opened port and both ingress relations at the given port.
+
+        Args:
+            port: port receiving traffic on this unit.
+        """
+        self.unit.set_ports(Port(protocol="tcp", port=port))
+        self._publish_ingress()
+        if self.unit.is_leader():
+            for relation in self.model.relations["nginx-route"]:
+                relation.data[self.app]["service-port"] = str(port)
+
+    def _update_ui_proxy(self, upstream_port):
+        """Point the ui-proxy at the given ui-server instance, or stop it when disabled.
+
+        Args:
+            upstream_port: port of the ui-server instance behind the proxy.
+        """
+        if not self._ui_proxy_enabled:
+            if self._stored.ui_proxy_started:
+                self._ui_proxy.stop()
+                self._stored.ui_proxy_started = False
+            return
+
+        context = {
+            "PORT": self.config["asset-proxy-port"],
+            "UPSTREAM_PORT": upstream_port,
+            "COMPRESSOR_PORT": COMPRESSOR_PORT,
+            "ASSET_CACHE_SIZE": self.config["asset-cache-size"],
+            "ASSETS_ENABLED": self.config["asset-proxy-enabled"],
+            "API_CACHE_ENABLED": self.config["api-cache-enabled"],
+            "API_CACHE_TTL": self.config["api-cache-ttl"],
+            "AUTH_ENABLED": self.config["auth-enabled"],
+            "METRICS_PORT": METRICS_PORT,
+            "CLUSTERS": self._ready_clusters(),
+        }
+        files = {CONFIG_PATH: render("ui-proxy.conf.jinja", context)}
+        if self.config["asset-proxy-enabled"]:
+            files[WARMUP_PATH] = render("ui-proxy-warmup.sh.jinja", context)
+        if self.config["api-cache-enabled"]:
+            files[METRICS_SCRIPT_PATH] = render("ui-proxy-metrics.js", context)
+
+        started = self._ui_proxy.update(
+            files, self.config["asset-proxy-port"], warm_up=self.config["asset-proxy-enabled"]
+        )
+        if started:
+            self._stored.ui_proxy_started = True
+
+    def _retire_service(self, container, service):
+        """Stop a ui-server instance and keep it from being started by a replan.
+
+        Args:
+            container: application container
+            service: name of the Pebble service to retire.
+        """
+        services = self._pebble_calls.get_services(container, service)
+        if service in services and services[service].is_running():
+            self._pebble_calls.stop(container, service)
+        self._pebble_calls.add_layer(
+            container, self.name, {"services": {service: {"override": "merge", "startup": "disabled"}}}, combine=True
+        )
+        if service == self._active_service:
+            self._stored.active_service = None
+
+    @property
+    def _active_service(self):
+        """Return the Pebble service currently receiving traffic on this unit."""
+        return self._stored.active_service or self.name
+
+    @property
+    def _published_port(self):
+        """Return the port on which this unit currently receives traffic."""
+        if self._ui_proxy_enabled:
+            return self.config["asset-proxy-port"]
+        return self._service_port(self._active_service)
+
+    @property
+    def _ui_proxy_enabled(self):
+        """Return whether traffic goes through the ui-proxy container.
+
+        The proxy also routes the URL paths of additional clusters to their instances.
+        """
+        return (
+            self.config["asset-proxy-enabled"]
+            or self.config["api-cache-enabled"]
+            or len(self.model.relations["ui"]) > 1
+        )
+
+    def _service_port(self, service):
+        """Return the port a ui-server instance listens on.
+
+        Args:
+            service: name of the Pebble service.
+
+        Returns:
+            The port number.
+        """
+        return self.config["port"] if service == self.name else self.config["blue-green-port"]
+
 
 if __name__ == "__main__":  # pragma: nocover
     main.main(TemporalUiK8SOperatorCharm)
@@ -0,0 +1,60 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Layout of the ui-server instances serving additional Temporal clusters."""
+
+CONFIG_DIR = "/home/ui-server/config"
+
+
+def primary_relation(relations):
+    """Return the ui relation served by the main ui-server instance.
+
+    Args:
+        relations: the ui:temporal relations.
+
+    Returns:
+        The oldest relation, or None if there is none.
+    """
+    return min(relations, key=lambda relation: relation.id, default=None)
+
+
+def extra_clusters(relations, port_start):
+    """Describe the ui-server instances serving the clusters beyond the primary one.
+
+    Each additional cluster is served by its own Pebble service under the
+    name of the related Temporal application, with its own config file and
+    port, and under its own URL path.
+
+    Args:
+        relations: the ui:temporal relations.
+        port_start: port of the first additional instance.
+
+    Returns:
+        A list of dicts with the relation, service, port, path and env of each
+        cluster, and whether its server is ready.
+    """
+    primary = primary_relation(relations)
+    others = sorted((r for r in relations if r is not primary and r.app), key=lambda r: r.id)
+    return [
+        {
+            "relation": relation,
+            "service": f"temporal-ui-{relation.app.name}",
+            "port": port_start + index,
+            "path": f"/{relation.app.name}",
+            "env": f"cluster-{relation.app.name}",
+            "ready": relation.data[relation.app].get("server_status") == "ready",
+        }
+        for index, relation in enumerate(others)
+    ]
+
+
+def config_path(cluster):
+    """Return the path of the config file of a cluster's ui-server instance.
+
+    Args:
+        cluster: cluster description from `extra_clusters`.
+
+    Returns:
+        The path inside the workload container.
+    """
+    return f"{CONFIG_DIR}/{cluster['env']}.yaml"
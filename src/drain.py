@@ -0,0 +1,105 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Helpers for draining and probing the workload around restarts."""
+
+import logging
+import time
+import urllib.error
+import urllib.request
+
+logger = logging.getLogger(__name__)
+
+# The charm container shares the pod network namespace with the workload,
+# so the kernel connection tables list the ui-server's connections too.
+TCP_TABLES = ("/proc/net/tcp", "/proc/net/tcp6")
+TCP_ESTABLISHED = "01"
+
+
+def active_connections(port, tables=TCP_TABLES):
+    """Count established TCP connections served on the given local port.
+
+    Args:
+        port: local port the workload listens on.
+        tables: kernel connection tables to read.
+
+    Returns:
+        Number of established connections.
+    """
+    count = 0
+    for table in tables:
+        try:
+            with open(table, encoding="ascii") as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            continue
+
+        for line in lines:
+            fields = line.split()
+            local_port = int(fields[1].rsplit(":", 1)[1], 16)
+            if local_port == port and fields[3] == TCP_ESTABLISHED:
+                count += 1
+    return count
+
+
+def wait_for_drain(port, timeout, poll_interval=1):
+    """Wait until the workload has no active connections or the timeout expires.
+
+    Args:
+        port: local port the workload listens on.
+        timeout: maximum number of seconds to wait.
+        poll_interval: number of seconds between two checks.
+
+    Returns:
+        Number of seconds spent draining.
+    """
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        connections = active_connections(port)
+        if connections == 0:
+            break
+        logger.info("waiting for %d connections to drain", connections)
+        time.sleep(poll_interval)
+    return time.monotonic() - start
+
+
+def wait_until_ready(url, timeout, poll_interval=1):
+    """Wait until the workload answers HTTP requests on the given URL.
+
+    Args:
+        url: URL probed for readiness.
+        timeout: maximum number of seconds to wait.
+        poll_interval: number of seconds between two probes.
+
+    Returns:
+        Number of seconds until the workload was ready.
+
+    Raises:
+        TimeoutError: if the workload is not ready before the timeout.
+    """
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            with urllib.request.urlopen(url, timeout=poll_interval):  # nosec B310
+                return time.monotonic() - start
+        except (urllib.error.URLError, OSError):
+            time.sleep(poll_interval)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def probe_latency(url, timeout):
+    """Time a single request to the workload.
+
+    Args:
+        url: URL probed.
+        timeout: maximum number of seconds to wait for the response.
+
+    Returns:
+        Number of seconds the request took, or None if it failed.
+    """
+    start = time.monotonic()
+    try:
+        with urllib.request.urlopen(url, timeout=timeout):  # nosec B310
+            return time.monotonic() - start
+    except (urllib.error.URLError, OSError):
+        return None
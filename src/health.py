@@ -0,0 +1,143 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Per-unit health summaries and their aggregation into the application status."""
+
+import json
+import logging
+import math
+import time
+
+from ops.framework import Object, StoredState
+from ops.model import ActiveStatus
+
+logger = logging.getLogger(__name__)
+
+HEALTH_KEY = "health"
+
+
+def percentile(values, pct):
+    """Return a percentile of the values with the nearest-rank method.
+
+    Args:
+        values: the values.
+        pct: the percentile, between 0 and 100.
+
+    Returns:
+        The percentile, or None if there are no values.
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class Health(Object):
+    """Publish this unit's health to its peers and summarise the application's on the leader.
+
+    Each unit writes a compact summary to its peer databag: whether its `up`
+    check passes, the latency of its last probe and how many times the charm
+    restarted it. Every write fires peer-relation-changed on all the other
+    units, so a summary is only rewritten right away when the check state
+    flips, and otherwise at most once every `health-report-interval` seconds.
+
+    Attrs:
+        summary: health summary published by this unit.
+    """
+
+    _stored = StoredState()
+
+    def __init__(self, charm, get_relation):
+        """Construct.
+
+        Args:
+            charm: the charm instance.
+            get_relation: get peer relation method.
+        """
+        super().__init__(charm, "health")
+        self._charm = charm
+        self._get_relation = get_relation
+        self._stored.set_default(restarts=0)
+
+    def _read(self, unit):
+        """Read the health summary published by a unit.
+
+        Args:
+            unit: unit whose databag is read.
+
+        Returns:
+            dict with the unit's health summary, empty if it published none.
+        """
+        relation = self._get_relation()
+        if not relation:
+            return {}
+        return json.loads(relation.data[unit].get(HEALTH_KEY, "{}"))
+
+    @property
+    def summary(self):
+        """Return the health summary published by this unit."""
+        return self._read(self._charm.unit)
+
+    def record_restart(self):
+        """Count a restart of the workload, reported with the next summary."""
+        self._stored.restarts += 1
+
+    def publish(self, up, latency=None):
+        """Publish this unit's health summary, subject to rate limiting.
+
+        Args:
+            up: whether the workload `up` check passes.
+            latency: seconds the last probe took, None to keep the previous value.
+
+        Returns:
+            True if the summary was written.
+        """
+        relation = self._get_relation()
+        if not relation:
+            return False
+
+        previous = self.summary
+        summary = {
+            "up": up,
+            "latency-ms": previous.get("latency-ms") if latency is None else round(latency * 1000),
+            "restarts": self._stored.restarts,
+        }
+        now = time.time()
+        flipped = previous.get("up") != up
+        due = now - previous.get("at", 0) >= self._charm.config["health-report-interval"]
+        if not flipped and not (due and summary != {k: previous.get(k) for k in summary}):
+            return False
+
+        relation.data[self._charm.unit][HEALTH_KEY] = json.dumps({**summary, "at": int(now)})
+        return True
+
+    def aggregate(self):
+        """Summarise the health of all units in the application status; leader only.
+
+        Returns:
+            The status message, or None if this unit is not the leader.
+        """
+        relation = self._get_relation()
+        if not relation or not self._charm.unit.is_leader():
+            return None
+
+        summaries = [self._read(unit) for unit in relation.units | {self._charm.unit}]
+        ready = [summary for summary in summaries if summary.get("up")]
+        latencies = [summary["latency-ms"] for summary in ready if summary.get("latency-ms") is not None]
+
+        message = f"{len(ready)}/{len(summaries)} units ready"
+        p95 = percentile(latencies, 95)
+        if p95 is not None:
+            message += f", p95 {p95}ms"
+
+        minimum = self._charm.config["min-ready-units"]
+        if len(ready) < minimum:
+            # The ready units still serve traffic, so the application is degraded, not blocked.
+            logger.warning("ready capacity below %d units: %s", minimum, message)
+            status = ActiveStatus(f"degraded, below min-ready-units: {message}")
+        else:
+            status = ActiveStatus(message)
+
+        if self._charm.app.status != status:
+            self._charm.app.status = status
+        return status.message
@@ -0,0 +1,147 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Cache host identity and network binding lookups across hooks."""
+
+import logging
+import os
+import socket
+
+from ops.framework import Object, StoredState
+
+logger = logging.getLogger(__name__)
+
+HOSTS_FILE = "/etc/hosts"
+
+
+def pod_ip(hostname, hosts_file=HOSTS_FILE):
+    """Read the pod IP from the hosts file Kubernetes writes into each container.
+
+    Args:
+        hostname: the pod's hostname.
+        hosts_file: path of the hosts file.
+
+    Returns:
+        The IP mapped to the hostname, or None if there is none.
+    """
+    try:
+        with open(hosts_file, encoding="utf-8") as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+
+    for line in lines:
+        fields = line.split("#", 1)[0].split()
+        if len(fields) > 1 and hostname in fields[1:]:
+            return fields[0]
+    return None
+
+
+def _dispatched_hook():
+    """Return the name of the hook being dispatched, with dashes.
+
+    Returns:
+        The hook name, such as upgrade-charm.
+    """
+    return os.path.basename(os.environ.get("JUJU_DISPATCH_PATH", "")).replace("_", "-")
+
+
+class HostFacts(Object):
+    """Host and network facts of the unit, cached in its local state.
+
+    `socket.getfqdn` may wait on reverse DNS and binding lookups shell out to
+    Juju, so their results are kept across hooks. The cache is dropped on
+    upgrade-charm and whenever the pod's hostname or IP changes, which only
+    costs reading /etc/hosts to detect.
+
+    Attrs:
+        fqdn: fully qualified domain name of the unit.
+    """
+
+    _stored = StoredState()
+
+    def __init__(self, charm):
+        """Construct.
+
+        Args:
+            charm: the charm instance.
+        """
+        super().__init__(charm, "host-facts")
+        self._charm = charm
+        self._stored.set_default(fingerprint=None, facts={})
+
+        hostname = socket.gethostname()
+        fingerprint = [hostname, pod_ip(hostname)]
+        if fingerprint != self._stored.fingerprint or _dispatched_hook() == "upgrade-charm":
+            logger.debug("host facts invalidated for %s", fingerprint)
+            self._stored.fingerprint = fingerprint
+            self._stored.facts = {}
+
+    def _cached(self, key, lookup):
+        """Return a cached fact, looking it up on a miss.
+
+        Args:
+            key: name of the fact.
+            lookup: callable computing the fact.
+
+        Returns:
+            The fact, or None if it could not be looked up. Missing facts are not cached.
+        """
+        facts = self._stored.facts
+        if key not in facts:
+            value = lookup()
+            if value is None:
+                return None
+            facts[key] = value
+        return facts[key]
+
+    @property
+    def fqdn(self):
+        """Return the fully qualified domain name of the unit."""
+        return self._cached("fqdn", socket.getfqdn)
+
+    def bind_address(self, endpoint):
+        """Return the address the unit binds to for a relation endpoint.
+
+        Args:
+            endpoint: name of the relation endpoint.
+
+        Returns:
+            The bind address as a string, or None if Juju does not know it.
+        """
+
+        def lookup():
+            """Ask Juju for the endpoint's binding.
+
+            Returns:
+                The bind address as a string, or None.
+            """
+            binding = self._charm.model.get_binding(endpoint)
+            if binding is None or binding.network.bind_address is None:
+                return None
+            return str(binding.network.bind_address)
+
+        return self._cached(f"bind-address/{endpoint}", lookup)
+
+    def subnets(self, endpoint):
+        """Return the networks of the unit's interfaces bound to a relation endpoint.
+
+        Args:
+            endpoint: name of the relation endpoint.
+
+        Returns:
+            A sorted list of CIDRs, or None if Juju does not know the binding.
+        """
+
+        def lookup():
+            """Ask Juju for the endpoint's interfaces.
+
+            Returns:
+                A sorted list of CIDRs, or None.
+            """
+            binding = self._charm.model.get_binding(endpoint)
+            if binding is None:
+                return None
+            return sorted({str(interface.subnet) for interface in binding.network.interfaces if interface.subnet})
+
+        return self._cached(f"subnets/{endpoint}", lookup)
@@ -0,0 +1,65 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Forward the ui-server logs to Loki through Pebble log targets."""
+
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+LOG_LEVELS = ("debug", "info", "warning", "error", "critical")
+TARGET_PREFIX = "loki-"
+
+
+def relation_endpoints(relation):
+    """Read the Loki push endpoints published over a logging relation.
+
+    Each unit of a loki_push_api provider publishes its push URL in its unit
+    databag, as a JSON object under the `endpoint` key.
+
+    Args:
+        relation: the logging relation.
+
+    Returns:
+        A sorted list of push URLs.
+    """
+    urls = set()
+    for unit in relation.units:
+        try:
+            urls.add(json.loads(relation.data[unit]["endpoint"])["url"])
+        except (KeyError, TypeError, json.JSONDecodeError):
+            logger.debug("no loki endpoint published by %s", unit.name)
+    return sorted(urls)
+
+
+def log_targets(endpoints, services, labels, current):
+    """Build the Pebble log targets pushing the services' logs to each endpoint.
+
+    Pebble buffers the log lines of each target and pushes them in batches,
+    so the workload never waits on Loki. Targets of endpoints that went away
+    are detached from all services, since a layer cannot remove them.
+
+    Args:
+        endpoints: Loki push URLs.
+        services: names of the Pebble services whose logs are forwarded.
+        labels: labels attached to every log line.
+        current: log targets of the current Pebble plan.
+
+    Returns:
+        A dict of log target names to their definitions.
+    """
+    targets = {
+        f"{TARGET_PREFIX}{index}": {
+            "override": "replace",
+            "type": "loki",
+            "location": url,
+            "services": sorted(services),
+            "labels": labels,
+        }
+        for index, url in enumerate(endpoints)
+    }
+    for name, target in current.items():
+        if name.startswith(TARGET_PREFIX) and name not in targets and target.services[-1:] != ["-all"]:
+            targets[name] = {"override": "merge", "services": ["-all"]}
+    return targets
@@ -0,0 +1,59 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Work out which destinations ui-server reaches without the model's HTTP proxy."""
+
+import urllib.parse
+
+# Domain suffixes of in-cluster Kubernetes service names.
+CLUSTER_SUFFIXES = (".svc", ".cluster.local")
+
+
+def target_host(target):
+    """Extract the host of a gRPC target or of a URL.
+
+    Args:
+        target: gRPC target such as `dns:///temporal-k8s:7233` or
+            `temporal-k8s:7233`, or a URL.
+
+    Returns:
+        The host, or None if the target has none.
+    """
+    if not target:
+        return None
+
+    parsed = urllib.parse.urlsplit(target) if "://" in target else None
+    if parsed is None:
+        netloc = target
+    elif parsed.scheme == "dns":
+        # The authority of a dns target names the DNS server, not the destination.
+        netloc = parsed.path.lstrip("/")
+    else:
+        netloc = parsed.netloc
+
+    try:
+        return urllib.parse.urlsplit(f"//{netloc}").hostname
+    except ValueError:
+        return None
+
+
+def no_proxy(base, hosts, cidrs):
+    """Extend a NO_PROXY list with the in-cluster destinations of the workload.
+
+    Go's HTTP and gRPC clients match NO_PROXY entries against the host name
+    before resolving it, and accept CIDRs for IP literals.
+
+    Args:
+        base: NO_PROXY value set for the model, possibly empty.
+        hosts: hosts the workload talks to directly.
+        cidrs: pod and service networks.
+
+    Returns:
+        The list of NO_PROXY entries, without duplicates, in order.
+    """
+    entries = []
+    for entry in [*(base or "").split(","), *hosts, *CLUSTER_SUFFIXES, *cidrs]:
+        entry = (entry or "").strip()
+        if entry and entry not in entries:
+            entries.append(entry)
+    return entries
@@ -0,0 +1,237 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Run Pebble operations under deadlines and bounded retries."""
+
+import logging
+import random
+import time
+
+from ops import pebble
+
+logger = logging.getLogger(__name__)
+
+# Longest a single operation waiting on a Pebble change may block, within the
+# 30s ops waits by default. Other calls are plain API requests bounded by the
+# client's socket timeout.
+OPERATION_TIMEOUTS = {"replan": 30, "restart": 30, "stop": 30, "exec": 30}
+RETRIES = 2
+# Operations taking longer than this are logged as warnings.
+SLOW_OPERATION = 10
+BACKOFF = 0.5
+RETRYABLE_ERRORS = (pebble.ConnectionError, pebble.TimeoutError)
+
+
+class HookBudgetExceededError(Exception):
+    """The hook ran out of time or retries for Pebble operations."""
+
+
+class PebbleCalls:
+    """Pebble operations sharing the time budget of the running hook.
+
+    Each operation gets at most its own timeout and whatever is left of the
+    budget. Connection errors and timeouts are retried a bounded number of
+    times with jittered backoff, and `HookBudgetExceededError` is raised once the
+    budget or the retries are spent, so that the caller can defer instead of
+    stalling the unit's event queue.
+
+    Attrs:
+        remaining: seconds left in the hook budget.
+        timings: list of (operation, seconds, attempts) of the completed operations.
+    """
+
+    def __init__(self, budget, retries=RETRIES, backoff=BACKOFF):
+        """Construct.
+
+        Args:
+            budget: seconds the hook may spend on Pebble operations, counted from now.
+            retries: number of retries of a failing operation.
+            backoff: base delay in seconds between retries, doubled on each attempt.
+        """
+        self._deadline = time.monotonic() + budget
+        self._retries = retries
+        self._backoff = backoff
+        self.timings = []
+
+    @property
+    def remaining(self):
+        """Return the seconds left in the hook budget."""
+        return self._deadline - time.monotonic()
+
+    def run(self, operation, func, *args, **kwargs):
+        """Run a Pebble operation within the hook budget, retrying transient failures.
+
+        Args:
+            operation: name of the operation, used for its timeout and in logs.
+            func: callable performing the operation.
+            args: positional arguments of the callable.
+            kwargs: keyword arguments of the callable.
+
+        Returns:
+            The result of the callable.
+
+        Raises:
+            HookBudgetExceededError: if the budget or the retries ran out before the
+                operation succeeded.
+        """
+        start = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            remaining = self.remaining
+            if remaining <= 0:
+                self._record(operation, start, attempt - 1)
+                raise HookBudgetExceededError(f"hook time budget exhausted before pebble {operation}")
+
+            if operation in OPERATION_TIMEOUTS:
+                kwargs["timeout"] = min(OPERATION_TIMEOUTS[operation], remaining)
+            try:
+                result = func(*args, **kwargs)
+            except RETRYABLE_ERRORS as err:
+                if attempt > self._retries:
+                    self._record(operation, start, attempt)
+                    raise HookBudgetExceededError(
+                        f"pebble {operation} still failing after {attempt} attempts: {err}"
+                    ) from err
+                delay = min(random.uniform(0, self._backoff * 2 ** (attempt - 1)), max(self.remaining, 0))
+                logger.warning("pebble %s failed (%s), retrying in %.1fs", operation, err, delay)
+                time.sleep(delay)
+                continue
+
+            self._record(operation, start, attempt)
+            return result
+
+    def _record(self, operation, start, attempts):
+        """Record how long an operation took.
+
+        Args:
+            operation: name of the operation.
+            start: monotonic time the operation started at.
+            attempts: number of attempts made.
+        """
+        seconds = time.monotonic() - start
+        self.timings.append((operation, seconds, attempts))
+        level = logging.WARNING if seconds > SLOW_OPERATION else logging.DEBUG
+        logger.log(level, "pebble %s took %.2fs in %d attempt(s)", operation, seconds, attempts)
+
+    def push(self, container, path, source, **kwargs):
+        """Write a file to a container.
+
+        Args:
+            container: the workload container.
+            path: path of the file inside the container.
+            source: contents of the file.
+            kwargs: other arguments of `Container.push`.
+        """
+        self.run("push", container.push, path, source, **kwargs)
+
+    def pull(self, container, path):
+        """Read a text file from a container.
+
+        Args:
+            container: the workload container.
+            path: path of the file inside the container.
+
+        Returns:
+            The contents of the file.
+        """
+        return self.run("pull", lambda: container.pull(path).read())
+
+    def remove_path(self, container, path):
+        """Remove a file from a container, if it exists.
+
+        Args:
+            container: the workload container.
+            path: path of the file inside the container.
+        """
+        self.run("remove_path", container.remove_path, path, recursive=True)
+
+    def add_layer(self, container, label, layer, combine=False):
+        """Add a layer to a container's plan.
+
+        Args:
+            container: the workload container.
+            label: label of the layer.
+            layer: layer dict.
+            combine: whether to combine with an existing layer of the same label.
+        """
+        self.run("add_layer", container.add_layer, label, layer, combine=combine)
+
+    def get_plan(self, container):
+        """Fetch a container's plan.
+
+        Args:
+            container: the workload container.
+
+        Returns:
+            The Pebble plan.
+        """
+        return self.run("get_plan", container.get_plan)
+
+    def get_check(self, container, name):
+        """Fetch the status of one of a container's checks.
+
+        Args:
+            container: the workload container.
+            name: name of the check.
+
+        Returns:
+            The check info.
+        """
+        return self.run("get_check", container.get_check, name)
+
+    def get_services(self, container, *services):
+        """Fetch the status of a container's services.
+
+        Args:
+            container: the workload container.
+            services: names of the services, all of them if none.
+
+        Returns:
+            A mapping of service names to their info.
+        """
+        return self.run("get_services", container.get_services, *services)
+
+    def replan(self, container):
+        """Replan a container's services.
+
+        Args:
+            container: the workload container.
+        """
+        self.run("replan", container.pebble.replan_services)
+
+    def restart(self, container, *services):
+        """Restart a container's services.
+
+        Args:
+            container: the workload container.
+            services: names of the services.
+        """
+        self.run("restart", container.pebble.restart_services, services)
+
+    def stop(self, container, *services):
+        """Stop a container's services.
+
+        Args:
+            container: the workload container.
+            services: names of the services.
+        """
+        self.run("stop", container.pebble.stop_services, services)
+
+    def exec(self, container, command):
+        """Run a command in a container and wait for it to exit.
+
+        Args:
+            container: the workload container.
+            command: the command and its arguments.
+        """
+
+        def run_command(timeout):
+            """Start the command and wait for it.
+
+            Args:
+                timeout: seconds the command may run for.
+            """
+            container.exec(command, timeout=timeout).wait()
+
+        self.run("exec", run_command)
@@ -0,0 +1,200 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Preview the changes a configuration update would make to the workload."""
+
+import difflib
+import re
+
+from ops import pebble
+
+# Keys whose values must never show in a preview: OIDC client secrets,
+# passwords and TLS private keys.
+SECRET_KEY_PATTERN = re.compile(r"secret|password|private[-_]?key|tls[-_]?key", re.IGNORECASE)
+REDACTED = "<redacted>"
+# A YAML mapping entry of a diff line, with its diff marker and indentation.
+YAML_ENTRY_PATTERN = re.compile(r"^(?P<key>[-+ ]?(?P<indent>\s*)(?:-\s+)?(?P<name>[\w.-]+):)(?P<value>.*)$")
+
+
+def is_secret(key):
+    """Tell whether a key holds a secret.
+
+    Args:
+        key: name of the key, possibly dotted.
+
+    Returns:
+        True if the value of the key must be redacted.
+    """
+    return bool(SECRET_KEY_PATTERN.search(key.rsplit(".", 1)[-1]))
+
+
+def redact_lines(lines):
+    """Redact the secret values of the lines of a unified diff of YAML files.
+
+    The values of keys named like secrets are replaced, as are the lines of
+    their block scalars, such as PEM-encoded keys.
+
+    Args:
+        lines: lines of the diff, with their line endings.
+
+    Returns:
+        The lines, with the values of secret keys replaced.
+    """
+    redacted = []
+    block_indent = None
+    for line in lines:
+        content = line.rstrip("\r\n")
+        ending = line.removeprefix(content)
+        if block_indent is not None:
+            if len(content[1:]) - len(content[1:].lstrip()) > block_indent or not content[1:].strip():
+                redacted.append(f"{content[:1]}{' ' * (block_indent + 2)}{REDACTED}{ending}")
+                continue
+            block_indent = None
+
+        match = YAML_ENTRY_PATTERN.match(content)
+        if match and match["value"].strip() and is_secret(match["name"]):
+            if match["value"].strip()[0] in "|>":
+                block_indent = len(match["indent"])
+            content = f"{match['key']} {REDACTED}"
+        redacted.append(content + ending)
+    return redacted
+
+
+def normalize_service(service):
+    """Stringify environment values as Pebble does.
+
+    Args:
+        service: service definition dict.
+
+    Returns:
+        Normalized service definition.
+    """
+    return {**service, "environment": {k: str(v) for k, v in service.get("environment", {}).items()}}
+
+
+def _flatten(value, prefix=""):
+    """Flatten nested dicts into dotted keys.
+
+    Args:
+        value: dict to flatten.
+        prefix: prefix of the keys.
+
+    Returns:
+        A dict of dotted keys to leaf values.
+    """
+    flat = {}
+    for key, item in value.items():
+        if isinstance(item, dict) and item:
+            flat.update(_flatten(item, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = item
+    return flat
+
+
+def field_changes(current, desired):
+    """List the fields that differ between two definitions.
+
+    Args:
+        current: current definition dict.
+        desired: desired definition dict.
+
+    Returns:
+        A sorted list of "field: old -> new" strings, with secret values redacted.
+    """
+    current, desired = _flatten(current), _flatten(desired)
+    return [
+        f"{key}: {REDACTED} -> {REDACTED}" if is_secret(key) else f"{key}: {current.get(key)} -> {desired.get(key)}"
+        for key in sorted(current.keys() | desired.keys())
+        if current.get(key) != desired.get(key)
+    ]
+
+
+def config_diff(path, current, desired):
+    """Diff a config file against its rendered replacement.
+
+    Args:
+        path: path of the file in the workload container.
+        current: current contents, None if the file does not exist.
+        desired: rendered contents.
+
+    Returns:
+        The unified diff with secret values redacted, empty if the contents match.
+    """
+    lines = difflib.unified_diff(
+        (current or "").splitlines(keepends=True),
+        desired.splitlines(keepends=True),
+        fromfile=path if current is not None else "/dev/null",
+        tofile=path,
+    )
+    return "".join(redact_lines(lines))
+
+
+def plan_diff(plan, pebble_layer):
+    """Compare the services and checks of a layer with the current plan.
+
+    Checks are only compared on the fields the layer sets, because the plan
+    also reports the defaults Pebble fills in.
+
+    Args:
+        plan: current Pebble plan.
+        pebble_layer: layer about to be added.
+
+    Returns:
+        A dict with the services the layer would add, the services and checks
+        it would change, each with their changed fields.
+    """
+    layer = pebble.Layer(pebble_layer)
+    diff = {"added": [], "services": {}, "checks": {}}
+    for name, service in layer.services.items():
+        current = plan.services.get(name)
+        if current is None:
+            diff["added"].append(name)
+            continue
+        changes = field_changes(normalize_service(current.to_dict()), normalize_service(service.to_dict()))
+        if changes:
+            diff["services"][name] = changes
+
+    for name, check in layer.checks.items():
+        desired = check.to_dict()
+        current = plan.checks[name].to_dict() if name in plan.checks else {}
+        changes = field_changes({key: current.get(key) for key in desired}, desired)
+        if changes:
+            diff["checks"][name] = changes
+    return diff
+
+
+def preview(config_diffs, diff, running, blue_green=False):
+    """Summarise what applying a configuration would do to the workload.
+
+    Args:
+        config_diffs: mapping of changed config file paths to their diffs.
+        diff: services and checks changes from `plan_diff`.
+        running: names of the running services.
+        blue_green: whether restart-causing changes go through a blue/green swap.
+
+    Returns:
+        A dict of action results saying whether a push, a layer change, a
+        replan and a restart would happen, why, and the diffs themselves.
+    """
+    reasons = [f"{path} changed" for path in config_diffs]
+    reasons += [f"service {name} would be started" for name in diff["added"]]
+    reasons += [f"service {name}: {change}" for name, changes in diff["services"].items() for change in changes]
+    reasons += [f"check {name}: {change}" for name, changes in diff["checks"].items() for change in changes]
+
+    restarted = sorted(name for name in diff["services"] if name in running)
+    replanned = bool(diff["added"] or diff["services"])
+    if restarted and blue_green:
+        restart = "no, the new configuration would be started next to the running one and swapped in"
+    elif restarted:
+        restart = f"yes, {', '.join(restarted)} after acquiring the rollout lock"
+    else:
+        restart = "no"
+
+    return {
+        "push": "yes" if config_diffs else "no",
+        "layer-change": "yes" if replanned or diff["checks"] else "no",
+        "replan": "yes" if replanned else "no",
+        "restart": restart,
+        "reasons": "\n".join(reasons) or "the workload is up to date",
+        "config-diff": "".join(config_diffs.values()),
+    }
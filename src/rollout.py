@@ -0,0 +1,203 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Peer-relation lock protocol for rolling out restart-causing changes."""
+
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+REQUESTED = "requested"
+APPLYING = "applying"
+DONE = "done"
+FAILED = "failed"
+
+
+class Rollout:
+    """Coordinate restart-causing changes so that units apply them in batches.
+
+    Each unit records its progress in its own peer relation databag under the
+    `rollout` key. The leader grants the lock through the application databag,
+    starting with a single canary unit and then `batch_size` units at a time.
+    A unit only releases its slot once its `up` check passes and the workload
+    answers a probe made after the change was applied; a unit that fails
+    its check pauses the whole rollout until it is resumed.
+
+    Attrs:
+        unit_state: rollout progress published by this unit.
+        status: summary of the lock record and this unit's progress.
+    """
+
+    def __init__(self, charm, state, get_relation):
+        """Construct.
+
+        Args:
+            charm: the charm instance.
+            state: application-wide state stored in the peer relation.
+            get_relation: get peer relation method.
+        """
+        self._charm = charm
+        self._state = state
+        self._get_relation = get_relation
+
+    @property
+    def unit_state(self):
+        """Return the rollout progress published by this unit."""
+        return self._read(self._charm.unit)
+
+    def _read(self, unit):
+        """Read the rollout progress published by a unit.
+
+        Args:
+            unit: unit whose databag is read.
+
+        Returns:
+            dict describing the unit's rollout progress.
+        """
+        relation = self._get_relation()
+        if not relation:
+            return {}
+        return json.loads(relation.data[unit].get("rollout", "{}"))
+
+    def _write(self, **progress):
+        """Publish this unit's rollout progress.
+
+        Args:
+            progress: rollout progress fields.
+        """
+        self._get_relation().data[self._charm.unit].update({"rollout": json.dumps(progress)})
+
+    def _lock(self):
+        """Return the lock record kept in the application databag.
+
+        Returns:
+            dict with the granted units, the canary unit and the paused flag.
+        """
+        return self._state.rollout or {"granted": [], "canary": None, "paused": False, "resumed_at": 0}
+
+    def _is_unresolved(self, progress):
+        """Report whether a failure happened after the last resume.
+
+        Args:
+            progress: rollout progress published by a unit.
+
+        Returns:
+            True if the failure should keep the rollout paused.
+        """
+        return progress.get("status") == FAILED and progress.get("failed_at", 0) > self._lock()["resumed_at"]
+
+    def acquire(self, revision):
+        """Request the rollout lock for the given revision.
+
+        Args:
+            revision: hash identifying the change the unit wants to apply.
+
+        Returns:
+            True if the unit may apply the change now.
+        """
+        progress = self.unit_state
+        if self._is_unresolved(progress):
+            return False
+        if progress.get("revision") != revision or progress.get("status") not in (REQUESTED, APPLYING):
+            self._write(status=REQUESTED, revision=revision)
+
+        if self._charm.unit.is_leader():
+            self.coordinate()
+
+        return self._charm.unit.name in self._lock()["granted"]
+
+    def applied(self, revision):
+        """Record that the change has been applied and is waiting to be healthy.
+
+        Args:
+            revision: hash identifying the applied change.
+        """
+        self._write(status=APPLYING, revision=revision, applied_at=time.time())
+
+    def failed(self, revision):
+        """Record that the change could not be applied on this unit.
+
+        Args:
+            revision: hash identifying the failed change.
+        """
+        self._write(status=FAILED, revision=revision, failed_at=time.time())
+        if self._charm.unit.is_leader():
+            self.coordinate()
+
+    def report_health(self, check_up, probe):
+        """Release or fail this unit's slot depending on its health.
+
+        Right after a replan, the `up` check keeps its previous status until
+        enough failures accumulate, so the slot is only released once the
+        workload also answers a probe made after the change was applied.
+
+        Args:
+            check_up: whether the workload `up` check currently passes.
+            probe: callable probing the workload, returning whether it answered.
+        """
+        progress = self.unit_state
+        if progress.get("status") != APPLYING:
+            return
+
+        if check_up and time.time() > progress["applied_at"] and probe():
+            logger.info("rollout of %s completed on this unit", progress["revision"])
+            self._write(status=DONE, revision=progress["revision"])
+            if self._charm.unit.is_leader():
+                self.coordinate()
+        elif time.time() - progress["applied_at"] > self._charm.config["rollout-health-timeout"]:
+            logger.error("rollout of %s failed on this unit", progress["revision"])
+            self.failed(progress["revision"])
+
+    def coordinate(self):
+        """Grant the rollout lock to waiting units; leader only."""
+        relation = self._get_relation()
+        if not relation or not self._charm.unit.is_leader():
+            return
+
+        units = {unit.name: self._read(unit) for unit in relation.units | {self._charm.unit}}
+        lock = self._lock()
+
+        if any(self._is_unresolved(progress) for progress in units.values()):
+            if not lock["paused"]:
+                logger.warning("pausing rollout: a unit failed its health check")
+            lock["paused"] = True
+
+        in_progress = {name for name, progress in units.items() if progress.get("status") in (REQUESTED, APPLYING)}
+        granted = [name for name in lock["granted"] if name in in_progress]
+        waiting = sorted(in_progress - set(granted))
+
+        if not in_progress:
+            lock["canary"] = None
+
+        if not lock["paused"] and waiting:
+            canary = lock["canary"]
+            if canary is None:
+                lock["canary"] = waiting[0]
+                granted.append(waiting[0])
+            elif canary not in in_progress:
+                slots = self._charm.config["rollout-batch-size"] - len(granted)
+                granted.extend(waiting[: max(slots, 0)])
+
+        lock["granted"] = granted
+        if lock != self._state.rollout:
+            self._state.rollout = lock
+
+    def resume(self):
+        """Clear the paused flag so that failed units can retry; leader only."""
+        lock = self._lock()
+        lock["paused"] = False
+        lock["canary"] = None
+        lock["resumed_at"] = time.time()
+        self._state.rollout = lock
+        self.coordinate()
+
+    @property
+    def status(self):
+        """Summarise the rollout as seen from this unit.
+
+        Returns:
+            dict with the lock record and this unit's progress.
+        """
+        return {"lock": self._lock(), "unit": self.unit_state}
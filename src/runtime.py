@@ -0,0 +1,125 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Derive Go runtime settings for ui-server from the workload container's cgroup limits."""
+
+import math
+import re
+
+from ops import pebble
+
+MIB = 1024 * 1024
+
+# Leave headroom between the soft GC target and the hard limit enforced by the kernel.
+MEMLIMIT_RATIO = 0.9
+# Containers this small collect more often so that they stay under their limit.
+SMALL_MEMORY_LIMIT = 512 * MIB
+SMALL_MEMORY_GOGC = "50"
+
+MEMLIMIT_PATTERN = re.compile(r"^\d+(B|KiB|MiB|GiB|TiB)?$")
+
+
+def _read(pebble_calls, container, path):
+    """Read a cgroup file from the workload container.
+
+    Args:
+        pebble_calls: Pebble operations of the running hook.
+        container: workload container.
+        path: path of the file inside the container.
+
+    Returns:
+        The stripped file contents, or None if the file does not exist.
+    """
+    try:
+        return pebble_calls.pull(container, path).strip()
+    except pebble.PathError:
+        return None
+
+
+def cgroup_limits(pebble_calls, container):
+    """Read the CPU quota and memory limit applied to the workload container.
+
+    Both cgroup v2 and v1 hierarchies are supported.
+
+    Args:
+        pebble_calls: Pebble operations of the running hook.
+        container: workload container.
+
+    Returns:
+        A (cpus, memory) tuple where cpus is a float number of CPUs and memory
+        is a number of bytes; either is None when unlimited or unknown.
+    """
+    cpus = None
+    cpu_max = _read(pebble_calls, container, "/sys/fs/cgroup/cpu.max")
+    if cpu_max is not None:
+        quota, period = cpu_max.split()
+        if quota != "max":
+            cpus = int(quota) / int(period)
+    else:
+        quota = _read(pebble_calls, container, "/sys/fs/cgroup/cpu/cpu.cfs_quota_us")
+        period = _read(pebble_calls, container, "/sys/fs/cgroup/cpu/cpu.cfs_period_us")
+        if quota is not None and period is not None and int(quota) > 0:
+            cpus = int(quota) / int(period)
+
+    memory = _read(pebble_calls, container, "/sys/fs/cgroup/memory.max")
+    if memory is None:
+        memory = _read(pebble_calls, container, "/sys/fs/cgroup/memory/memory.limit_in_bytes")
+    # cgroup v1 reports an absurdly large number instead of "max" when unlimited.
+    if memory is None or memory == "max" or int(memory) >= 2**62:
+        memory = None
+    else:
+        memory = int(memory)
+
+    return cpus, memory
+
+
+def go_runtime_env(pebble_calls, container, config):
+    """Compute GOMAXPROCS, GOMEMLIMIT and GOGC for the ui-server service.
+
+    Explicit values from the charm config take precedence over derived ones.
+    Settings that cannot be derived are left to the Go defaults.
+
+    Args:
+        pebble_calls: Pebble operations of the running hook.
+        container: workload container.
+        config: the charm config.
+
+    Returns:
+        A dict of environment variables.
+    """
+    cpus, memory = cgroup_limits(pebble_calls, container)
+
+    env = {}
+    if config["go-maxprocs"] > 0:
+        env["GOMAXPROCS"] = str(config["go-maxprocs"])
+    elif cpus is not None:
+        env["GOMAXPROCS"] = str(max(1, math.ceil(cpus)))
+
+    if config["go-memlimit"]:
+        env["GOMEMLIMIT"] = config["go-memlimit"]
+    elif memory is not None:
+        env["GOMEMLIMIT"] = f"{int(memory * MEMLIMIT_RATIO) // MIB}MiB"
+
+    if config["go-gc"]:
+        env["GOGC"] = config["go-gc"]
+    elif memory is not None and memory <= SMALL_MEMORY_LIMIT:
+        env["GOGC"] = SMALL_MEMORY_GOGC
+
+    return env
+
+
+def validate_go_runtime(config):
+    """Validate the Go runtime overrides.
+
+    Args:
+        config: the charm config.
+
+    Raises:
+        ValueError: in case of invalid configuration.
+    """
+    if config["go-maxprocs"] < 0:
+        raise ValueError("Invalid config: go-maxprocs must not be negative")
+    if config["go-memlimit"] and not MEMLIMIT_PATTERN.match(config["go-memlimit"]):
+        raise ValueError("Invalid config: go-memlimit must be a size such as 512MiB")
+    if config["go-gc"] and not (config["go-gc"] == "off" or config["go-gc"].isdigit()):
+        raise ValueError("Invalid config: go-gc must be a percentage or off")
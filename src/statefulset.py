@@ -0,0 +1,221 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Reconcile the pod template of the charm's StatefulSet with the charm config."""
+
+import logging
+
+from lightkube import Client
+from lightkube.resources.apps_v1 import StatefulSet
+from lightkube.types import PatchType
+from lightkube.utils.quantity import parse_quantity
+
+logger = logging.getLogger(__name__)
+
+HOSTNAME_TOPOLOGY_KEY = "kubernetes.io/hostname"
+ZONE_TOPOLOGY_KEY = "topology.kubernetes.io/zone"
+SPREAD_MODES = {"soft": "ScheduleAnyway", "hard": "DoNotSchedule"}
+
+RESOURCE_OPTIONS = {
+    "requests": {"cpu": "cpu-request", "memory": "memory-request"},
+    "limits": {"cpu": "cpu-limit", "memory": "memory-limit"},
+}
+
+
+def resource_requirements(config):
+    """Build the container resource requirements requested by the charm config.
+
+    Args:
+        config: the charm config.
+
+    Returns:
+        A dict with the `requests` and `limits` of the workload container.
+    """
+    return {
+        section: {resource: config[option] for resource, option in options.items() if config[option]}
+        for section, options in RESOURCE_OPTIONS.items()
+    }
+
+
+def validate_resources(config):
+    """Validate the resource requests and limits set in the charm config.
+
+    Args:
+        config: the charm config.
+
+    Raises:
+        ValueError: in case of invalid configuration.
+    """
+    requirements = resource_requirements(config)
+    for section, options in RESOURCE_OPTIONS.items():
+        for resource, option in options.items():
+            try:
+                parse_quantity(requirements[section].get(resource))
+            except ValueError as err:
+                raise ValueError(f"Invalid config: {option} is not a valid quantity") from err
+
+    for resource, limit in requirements["limits"].items():
+        request = requirements["requests"].get(resource)
+        if request and parse_quantity(request) > parse_quantity(limit):
+            raise ValueError(f"Invalid config: {resource}-request exceeds {resource}-limit")
+
+
+def spread_constraints(app_name, config):
+    """Build the topology spread constraints requested by the charm config.
+
+    Only the spread across nodes is enforced in "hard" mode: the scheduler
+    rules out nodes missing the topology key of a DoNotSchedule constraint,
+    so a hard zone constraint would leave every pod unschedulable on clusters
+    whose nodes carry no zone label.
+
+    Args:
+        app_name: name of the application whose pods are spread.
+        config: the charm config.
+
+    Returns:
+        A list of topology spread constraints, empty when spreading is disabled.
+    """
+    mode = config["pod-spread"]
+    if mode == "none":
+        return []
+    policies = {HOSTNAME_TOPOLOGY_KEY: SPREAD_MODES[mode], ZONE_TOPOLOGY_KEY: SPREAD_MODES["soft"]}
+    return [
+        {
+            "maxSkew": 1,
+            "topologyKey": key,
+            "whenUnsatisfiable": policy,
+            "labelSelector": {"matchLabels": {"app.kubernetes.io/name": app_name}},
+        }
+        for key, policy in policies.items()
+    ]
+
+
+def validate_spread(config):
+    """Validate the pod spreading mode set in the charm config.
+
+    Args:
+        config: the charm config.
+
+    Raises:
+        ValueError: in case of invalid configuration.
+    """
+    if config["pod-spread"] not in ("none", *SPREAD_MODES):
+        raise ValueError("Invalid config: pod-spread must be one of none, soft or hard")
+
+
+def _normalize(section):
+    """Parse the quantities of a requests or limits section for comparison.
+
+    Args:
+        section: mapping of resource names to quantities, or None.
+
+    Returns:
+        A dict of resource names to parsed quantities.
+    """
+    return {resource: parse_quantity(quantity) for resource, quantity in (section or {}).items()}
+
+
+class StatefulSetPatcher:
+    """Patch the pod template of the StatefulSet Juju creates for the application.
+
+    Patches are only sent when the live object differs from the desired state,
+    because every change to the pod template rolls all the application's pods.
+
+    Attrs:
+        client: lightkube client, created on first use.
+    """
+
+    def __init__(self, app_name, namespace, container_name):
+        """Construct.
+
+        Args:
+            app_name: name of the application and of its StatefulSet.
+            namespace: Kubernetes namespace of the Juju model.
+            container_name: name of the workload container in the pod template.
+        """
+        self._app_name = app_name
+        self._namespace = namespace
+        self._container_name = container_name
+        self._client = None
+
+    @property
+    def client(self):
+        """Return the lightkube client, creating it on first use."""
+        if self._client is None:
+            self._client = Client(field_manager=self._app_name)
+        return self._client
+
+    def _get(self):
+        """Fetch the application's StatefulSet.
+
+        Returns:
+            The StatefulSet resource.
+        """
+        return self.client.get(StatefulSet, name=self._app_name, namespace=self._namespace)
+
+    def _patch(self, patch):
+        """Apply a strategic merge patch to the application's StatefulSet.
+
+        Args:
+            patch: the patch to apply.
+        """
+        self.client.patch(
+            StatefulSet,
+            name=self._app_name,
+            namespace=self._namespace,
+            obj=patch,
+            patch_type=PatchType.STRATEGIC,
+        )
+
+    def reconcile(self, config):
+        """Make the pod template match the charm config with at most one patch.
+
+        Args:
+            config: the charm config.
+
+        Returns:
+            True if the StatefulSet was patched.
+        """
+        pod_spec = self._get().spec.template.spec
+        patch = {}
+
+        resources = self._resources_patch(pod_spec, config)
+        if resources is not None:
+            patch["containers"] = [{"name": self._container_name, "resources": resources}]
+
+        current = [constraint.to_dict() for constraint in pod_spec.topologySpreadConstraints or []]
+        desired = spread_constraints(self._app_name, config)
+        if current != desired:
+            # A null value removes the field altogether.
+            patch["topologySpreadConstraints"] = desired or None
+
+        if not patch:
+            return False
+
+        logger.info("patching the pod template of %s: %s", self._app_name, patch)
+        self._patch({"spec": {"template": {"spec": patch}}})
+        return True
+
+    def _resources_patch(self, pod_spec, config):
+        """Compute the change to the workload container's resources.
+
+        Args:
+            pod_spec: current pod spec of the StatefulSet.
+            config: the charm config.
+
+        Returns:
+            The resources to patch, or None if they already match the config.
+        """
+        container = next(c for c in pod_spec.containers if c.name == self._container_name)
+        current = container.resources
+        desired = resource_requirements(config)
+
+        if all(_normalize(getattr(current, section, None)) == _normalize(desired[section]) for section in desired):
+            return None
+
+        resources = {}
+        for section, quantities in desired.items():
+            # Strategic merge patches only remove keys that are explicitly set to null.
+            stale = {resource: None for resource in (getattr(current, section, None) or {})}
+            resources[section] = {**stale, **quantities}
+        return resources
@@ -0,0 +1,164 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Manage the caching reverse proxy running in front of ui-server."""
+
+import logging
+
+from ops import pebble
+
+logger = logging.getLogger(__name__)
+
+CONTAINER = "ui-proxy"
+SERVICE = "ui-proxy"
+WARMUP_SERVICE = "ui-proxy-warmup"
+CONFIG_PATH = "/etc/nginx/ui-proxy.conf"
+WARMUP_PATH = "/etc/nginx/ui-proxy-warmup.sh"
+METRICS_SCRIPT_PATH = "/etc/nginx/njs/ui-proxy-metrics.js"
+# Loopback-only port of the server compressing assets before they are cached.
+COMPRESSOR_PORT = 18080
+# Port serving the API cache metrics in the Prometheus text format.
+METRICS_PORT = 9113
+
+
+class UiProxy:
+    """Run nginx in the ui-proxy container to cache static assets and read-only API calls.
+
+    The proxy is reloaded in place when its configuration changes, so that
+    open connections and the caches survive upstream port switches.
+    """
+
+    def __init__(self, charm, pebble_calls):
+        """Construct.
+
+        Args:
+            charm: the charm instance.
+            pebble_calls: Pebble operations bounded by the hook time budget.
+        """
+        self._charm = charm
+        self._pebble_calls = pebble_calls
+
+    @property
+    def _container(self):
+        """Return the proxy container."""
+        return self._charm.unit.get_container(CONTAINER)
+
+    def update(self, files, port, warm_up=False):
+        """Apply the proxy configuration and start the proxy if needed.
+
+        Args:
+            files: mapping of paths in the proxy container to their contents,
+                including the nginx configuration.
+            port: port the proxy listens on.
+            warm_up: whether to warm up the asset cache after a change.
+
+        Returns:
+            False if the proxy container is not reachable yet.
+        """
+        container = self._container
+        if not container.can_connect():
+            return False
+
+        # Every file must be pushed, so the writes are not short-circuited.
+        changed = any([self._push_if_changed(container, path, content) for path, content in files.items()])
+
+        services = self._pebble_calls.get_services(container, SERVICE)
+        running = SERVICE in services and services[SERVICE].is_running()
+
+        self._pebble_calls.add_layer(container, CONTAINER, self._pebble_layer(port), combine=True)
+        self._pebble_calls.replan(container)
+
+        if changed and running:
+            self._reload(container)
+        if changed and warm_up:
+            logger.info("warming up the asset cache")
+            self._pebble_calls.restart(container, WARMUP_SERVICE)
+        return True
+
+    def stop(self):
+        """Stop the proxy if it is running."""
+        container = self._container
+        if not container.can_connect():
+            return
+
+        services = self._pebble_calls.get_services(container, SERVICE, WARMUP_SERVICE)
+        running = [name for name, service in services.items() if service.is_running()]
+        if running:
+            logger.info("stopping the ui proxy")
+            self._pebble_calls.stop(container, *running)
+        if SERVICE in services:
+            self._pebble_calls.add_layer(
+                container,
+                CONTAINER,
+                {"services": {SERVICE: {"override": "merge", "startup": "disabled"}}},
+                combine=True,
+            )
+
+    def _push_if_changed(self, container, path, content):
+        """Push a file to the proxy container unless it is already up to date.
+
+        Args:
+            container: proxy container.
+            path: path of the file inside the container.
+            content: expected file contents.
+
+        Returns:
+            True if the file was written.
+        """
+        try:
+            if self._pebble_calls.pull(container, path) == content:
+                return False
+        except pebble.PathError:
+            pass
+        self._pebble_calls.push(container, path, content, make_dirs=True)
+        return True
+
+    def _reload(self, container):
+        """Make nginx load its new configuration without dropping connections.
+
+        Args:
+            container: proxy container.
+        """
+        logger.info("reloading the ui proxy configuration")
+        try:
+            self._pebble_calls.exec(container, ["nginx", "-s", "reload", "-c", CONFIG_PATH])
+        except (pebble.ExecError, pebble.ChangeError) as err:
+            logger.warning("failed to reload the ui proxy, restarting it: %s", err)
+            self._pebble_calls.restart(container, SERVICE)
+
+    def _pebble_layer(self, port):
+        """Build the Pebble layer running the proxy.
+
+        Args:
+            port: port the proxy listens on.
+
+        Returns:
+            The Pebble layer dict.
+        """
+        return {
+            "summary": "temporal ui proxy layer",
+            "services": {
+                SERVICE: {
+                    "summary": "temporal ui caching proxy",
+                    "command": f"nginx -c {CONFIG_PATH} -g 'daemon off;'",
+                    "startup": "enabled",
+                    "override": "replace",
+                    "on-check-failure": {"proxy-up": "restart"},
+                },
+                WARMUP_SERVICE: {
+                    "summary": "temporal ui asset cache warm-up",
+                    "command": f"sh {WARMUP_PATH}",
+                    "startup": "disabled",
+                    "override": "replace",
+                    "on-success": "ignore",
+                    "on-failure": "ignore",
+                },
+            },
+            "checks": {
+                "proxy-up": {
+                    "override": "replace",
+                    "period": "10s",
+                    "http": {"url": f"http://localhost:{port}/proxy-healthz"},
+                }
+            },
+        }
@@ -0,0 +1,50 @@
+// Record the cache status and upstream latency of the cached UI API calls,
+// and serve them in the Prometheus text format.
+
+const BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10];
+const STATUSES = ["HIT", "MISS", "EXPIRED", "STALE", "UPDATING", "REVALIDATED", "BYPASS"];
+
+function record(r) {
+    const metrics = ngx.shared.api_metrics;
+    metrics.incr(`requests:${r.variables.upstream_cache_status || "BYPASS"}`, 1, 0);
+
+    // Several times are reported when nginx had to try more than one upstream.
+    const times = (r.variables.upstream_response_time || "")
+        .split(/[,:]/)
+        .map((time) => parseFloat(time))
+        .filter((time) => !isNaN(time));
+    if (times.length) {
+        const seconds = times.reduce((total, time) => total + time, 0);
+        metrics.incr("upstream:count", 1, 0);
+        metrics.incr("upstream:sum", seconds, 0);
+        BUCKETS.filter((le) => seconds <= le).forEach((le) => metrics.incr(`upstream:le:${le}`, 1, 0));
+    }
+
+    // An empty value keeps access_log from writing anything.
+    return "";
+}
+
+function metrics(r) {
+    const values = ngx.shared.api_metrics;
+    const count = values.get("upstream:count") || 0;
+    const lines = [
+        "# HELP temporal_ui_api_cache_requests_total Cacheable UI API requests by cache status.",
+        "# TYPE temporal_ui_api_cache_requests_total counter",
+        ...STATUSES.map(
+            (status) => `temporal_ui_api_cache_requests_total{status="${status}"} ${values.get(`requests:${status}`) || 0}`
+        ),
+        "# HELP temporal_ui_api_upstream_latency_seconds Latency of the cacheable UI API calls forwarded to ui-server.",
+        "# TYPE temporal_ui_api_upstream_latency_seconds histogram",
+        ...BUCKETS.map(
+            (le) => `temporal_ui_api_upstream_latency_seconds_bucket{le="${le}"} ${values.get(`upstream:le:${le}`) || 0}`
+        ),
+        `temporal_ui_api_upstream_latency_seconds_bucket{le="+Inf"} ${count}`,
+        `temporal_ui_api_upstream_latency_seconds_sum ${values.get("upstream:sum") || 0}`,
+        `temporal_ui_api_upstream_latency_seconds_count ${count}`,
+    ];
+
+    r.headersOut["Content-Type"] = "text/plain; version=0.0.4";
+    r.return(200, lines.join("\n") + "\n");
+}
+
+export default { record, metrics };
@@ -0,0 +1,91 @@
+# Copyright 2023 Canonical Ltd.
+# See LICENSE file for licensing details.
+
+"""Microbenchmark of DatabagModel.load in the vendored ingress library.
+
+Compares the previous implementation, which re-serialised the decoded
+databag and parsed it again through pydantic, with the current one, both on
+a first read and on the memoised reads that follow within a dispatch.
+
+Run it under each major pydantic version, for example with
+`tox -e benchmark-pydantic1,benchmark-pydantic2`.
+"""
+
+import json
+import timeit
+
+import pydantic
+from charms.traefik_k8s.v2 import ingress
+from charms.traefik_k8s.v2.ingress import IngressProviderAppData, IngressRequirerAppData
+
+ITERATIONS = 5000
+
+DATABAGS = {
+    IngressRequirerAppData: {
+        "model": json.dumps("temporal"),
+        "name": json.dumps("temporal-ui-k8s"),
+        "port": json.dumps(8080),
+        "strip-prefix": json.dumps(True),
+        "healthcheck_params": json.dumps({"path": "/healthz", "interval": "10s", "timeout": "2s"}),
+        # Keys set by Juju are not part of the model.
+        "egress-subnets": "10.1.0.0/32",
+        "ingress-address": "10.1.0.12",
+        "private-address": "10.1.0.12",
+    },
+    IngressProviderAppData: {
+        "ingress": json.dumps({"url": "http://traefik.example.com/temporal-temporal-ui-k8s"}),
+    },
+}
+
+
+def legacy_load(model, databag):
+    """Load a model the way the library did before memoisation.
+
+    Args:
+        model: the databag model.
+        databag: the raw databag.
+
+    Returns:
+        The loaded model.
+    """
+    if ingress.PYDANTIC_IS_V1:
+        aliases = {f.alias for f in model.__fields__.values()}
+        data = {k: json.loads(v) for k, v in databag.items() if k in aliases}
+        return model.parse_raw(json.dumps(data))
+
+    aliases = {(f.alias or n) for n, f in model.model_fields.items()}
+    data = {k: json.loads(v) for k, v in databag.items() if k in aliases}
+    return model.model_validate_json(json.dumps(data))
+
+
+def cold_load(model, databag):
+    """Load a model with an empty memo, as on the first read of a dispatch.
+
+    Args:
+        model: the databag model.
+        databag: the raw databag.
+
+    Returns:
+        The loaded model.
+    """
+    ingress._LOAD_MEMO.clear()
+    return model.load(databag)
+
+
+def main():
+    """Time each implementation and print the results in microseconds per load."""
+    print(f"pydantic {pydantic.version.VERSION}, {ITERATIONS} loads per measurement")
+    for model, databag in DATABAGS.items():
+        assert legacy_load(model, databag) == cold_load(model, databag)
+
+        timings = {
+            "legacy": timeit.timeit(lambda: legacy_load(model, databag), number=ITERATIONS),
+            "cold": timeit.timeit(lambda: cold_load(model, databag), number=ITERATIONS),
+            "memoised": timeit.timeit(lambda: model.load(databag), number=ITERATIONS),
+        }
+        results = ", ".join(f"{name} {seconds / ITERATIONS * 1e6:.1f}us" for name, seconds in timings.items())
+        print(f"{model.__name__}: {results}")
+
+
+if __name__ == "__main__":
+    main()
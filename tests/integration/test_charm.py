@@ -38,7 +38,10 @@ async def deploy(ops_test: OpsTest):
     )
 
     charm = await ops_test.build_charm(".")
-    resources = {"temporal-ui-image": METADATA["containers"]["temporal-ui"]["upstream-source"]}
+    resources = {
+        "temporal-ui-image": METADATA["containers"]["temporal-ui"]["upstream-source"],
+        "ui-proxy-image": METADATA["containers"]["ui-proxy"]["upstream-source"],
+    }
 
     await ops_test.model.deploy(charm, resources=resources, application_name=APP_NAME)
 
@@ -145,6 +148,25 @@ class TestDeployment:
 
             assert ops_test.model.applications[APP_NAME].units[0].workload_status == "active"
 
+    async def test_frontend_round_robin(self, ops_test: OpsTest):
+        """Reach the frontend through the round_robin policy ui-server dials with."""
+        unit = f"{APP_NAME}/0"
+        # The default gRPC service config ui-server passes when dialing the frontend.
+        service_config = '{"loadBalancingConfig": [{"round_robin":{}}]}'
+        return_code, stdout, _ = await ops_test.juju(
+            "ssh", "--container", "temporal-ui", unit, "grep", "-cF", service_config, "/home/ui-server/ui-server"
+        )
+        assert return_code == 0 and int(stdout.strip()) > 0
+
+        await ops_test.model.applications[APP_NAME].set_config({"frontend-load-balancing": "round-robin"})
+        async with ops_test.fast_forward():
+            await ops_test.model.wait_for_idle(apps=[APP_NAME], status="active", raise_on_blocked=False, timeout=600)
+
+        status = await ops_test.model.get_status()  # noqa: F821
+        address = status["applications"][APP_NAME]["units"][unit]["address"]
+        response = requests.get(f"http://{address}:8080/api/v1/namespaces", timeout=30)
+        assert response.status_code == 200
+
     async def test_scaling_up(self, ops_test: OpsTest):
         """Scale Temporal worker charm up to 2 units."""
         await scale(ops_test, app=APP_NAME, units=2)
@@ -45,7 +45,10 @@ async def deploy(ops_test: OpsTest):
 
     # Build and deploy temporal-ui-k8s
     charm = await ops_test.build_charm(".")
-    resources = {"temporal-ui-image": METADATA["containers"]["temporal-ui"]["upstream-source"]}
+    resources = {
+        "temporal-ui-image": METADATA["containers"]["temporal-ui"]["upstream-source"],
+        "ui-proxy-image": METADATA["containers"]["ui-proxy"]["upstream-source"],
+    }
     await ops_test.model.deploy(charm, resources=resources, application_name=APP_NAME)
 
     # Add all required relations
@@ -2,9 +2,14 @@
 # See LICENSE file for licensing details.
 
 import json
+import unittest.mock
 
 import ops.testing
 import pytest
+from lightkube.models.apps_v1 import StatefulSetSpec
+from lightkube.models.core_v1 import Container, PodSpec, PodTemplateSpec
+from lightkube.models.meta_v1 import LabelSelector
+from lightkube.resources.apps_v1 import StatefulSet
 
 from charm import TemporalUiK8SOperatorCharm
 
@@ -126,3 +131,30 @@ def traefik_ingress_relation():
 @pytest.fixture(scope="function")
 def nginx_relation():
     return ops.testing.Relation("nginx-route")
+
+
+@pytest.fixture(scope="function")
+def statefulset():
+    return StatefulSet(
+        spec=StatefulSetSpec(
+            selector=LabelSelector(),
+            serviceName="temporal-ui-k8s-endpoints",
+            template=PodTemplateSpec(spec=PodSpec(containers=[Container(name="charm"), Container(name="temporal-ui")])),
+        )
+    )
+
+
+@pytest.fixture(autouse=True)
+def lightkube_client(statefulset):
+    with unittest.mock.patch("statefulset.Client") as client:
+        client.return_value.get.return_value = statefulset
+        yield client.return_value
+
+
+@pytest.fixture(scope="function")
+def ui_proxy_container():
+    return ops.testing.Container(
+        "ui-proxy",
+        can_connect=True,
+        execs={ops.testing.Exec(["nginx", "-s", "reload"])},
+    )
@@ -2,16 +2,44 @@
 # See LICENSE file for licensing details.
 
 import dataclasses
+import json
 import logging
+import socket
 import unittest.mock
 
 import ops
 import ops.testing
 import pytest
+from charms.traefik_k8s.v2 import ingress
+from lightkube.core.exceptions import ApiError
+from lightkube.models.core_v1 import ResourceRequirements, TopologySpreadConstraint
+
+import drain
+import health
+import host_facts
+import no_proxy
+import pebble_calls
+import statefulset as statefulset_module
 
 logger = logging.getLogger(__name__)
 
 UI_PORT = "8080"
+CHARM = "TemporalUiK8SOperatorCharm"
+
+
+def stored(state, **content):
+    """Read the charm's unit-local StoredState, or build one for an input state.
+
+    Args:
+        state: the state to read from.
+        content: content of the StoredState to build.
+
+    Returns:
+        The content of the StoredState of the state, or a new StoredState if content is given.
+    """
+    if not content:
+        return state.get_stored_state("_stored", owner_path=CHARM).content
+    return ops.testing.StoredState(owner_path=CHARM, content=content)
 
 
 @pytest.fixture
@@ -103,6 +131,9 @@ def test_ingress_with_nginx(
     state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
     state_out = context.run(context.on.relation_changed(ui_relation), state_out)
 
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    state_out = context.run(context.on.relation_joined(nginx_relation), state_out)
+
     state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
     with context(context.on.config_changed(), state_out) as manager:
         manager.charm._require_nginx_route()
@@ -166,6 +197,7 @@ def test_ready(context, state, temporal_ui_container, temporal_ui_container_init
                 "startup": "enabled",
                 "override": "replace",
                 "environment": {
+                    "TEMPORAL_ADDRESS": "remote:7233",
                     "LOG_LEVEL": "info",
                     "TEMPORAL_UI_PORT": 8080,
                     "TEMPORAL_DEFAULT_NAMESPACE": "default",
@@ -178,6 +210,8 @@ def test_ready(context, state, temporal_ui_container, temporal_ui_container_init
                     "TEMPORAL_CODEC_ENDPOINT": "",
                     "TEMPORAL_CODEC_PASS_ACCESS_TOKEN": False,
                     "TEMPORAL_BATCH_ACTIONS_DISABLED": False,
+                    "TEMPORAL_REFRESH_INTERVAL": "1m",
+                    "TEMPORAL_NOTIFY_ON_NEW_VERSION": False,
                 },
                 "on-check-failure": {"up": "ignore"},
             }
@@ -187,7 +221,14 @@ def test_ready(context, state, temporal_ui_container, temporal_ui_container_init
                 "http": {"url": "http://localhost:8080/"},
                 "override": "replace",
                 "period": "10s",
-            }
+            },
+            "serving": {
+                "exec": {"command": "sh -c 'test ! -e /tmp/temporal-ui-withdrawn'"},
+                "level": "ready",
+                "override": "replace",
+                "period": "1s",
+                "threshold": 1,
+            },
         },
     }
 
@@ -219,6 +260,7 @@ def test_auth(
                     "startup": "enabled",
                     "override": "replace",
                     "environment": {
+                        "TEMPORAL_ADDRESS": "remote:7233",
                         "LOG_LEVEL": "info",
                         "TEMPORAL_UI_PORT": 8080,
                         "TEMPORAL_DEFAULT_NAMESPACE": "default",
@@ -236,6 +278,8 @@ def test_auth(
                         "TEMPORAL_CODEC_ENDPOINT": "",
                         "TEMPORAL_CODEC_PASS_ACCESS_TOKEN": False,
                         "TEMPORAL_BATCH_ACTIONS_DISABLED": False,
+                        "TEMPORAL_REFRESH_INTERVAL": "1m",
+                        "TEMPORAL_NOTIFY_ON_NEW_VERSION": False,
                     },
                     "on-check-failure": {"up": "ignore"},
                 }
@@ -245,7 +289,14 @@ def test_auth(
                     "http": {"url": "http://localhost:8080/"},
                     "override": "replace",
                     "period": "10s",
-                }
+                },
+                "serving": {
+                    "exec": {"command": "sh -c 'test ! -e /tmp/temporal-ui-withdrawn'"},
+                    "level": "ready",
+                    "override": "replace",
+                    "period": "1s",
+                    "threshold": 1,
+                },
             },
         }
     )
@@ -333,3 +384,1287 @@ def test_missing_pebble_plan(context, state, temporal_ui_container, temporal_ui_
         assert state_out.unit_status == ops.MaintenanceStatus("replanning application")
 
         assert state_out.get_container("temporal-ui").plan.to_dict() is not None
+
+
+def test_rollout_canary_on_leader(context, state, temporal_ui_container_initialized, peer_relation):
+    state = dataclasses.replace(state, containers=[temporal_ui_container_initialized])
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    lock = json.loads(state_out.get_relation(peer_relation.id).local_app_data["rollout"])
+    assert lock["granted"] == ["temporal-ui-k8s/0"]
+    assert lock["canary"] == "temporal-ui-k8s/0"
+    assert json.loads(state_out.get_relation(peer_relation.id).local_unit_data["rollout"])["status"] == "applying"
+    assert state_out.unit_status == ops.MaintenanceStatus("replanning application")
+
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    with unittest.mock.patch("charm.probe_latency", return_value=0.1):
+        state_out = context.run(context.on.update_status(), state_out)
+
+    assert json.loads(state_out.get_relation(peer_relation.id).local_unit_data["rollout"])["status"] == "done"
+    assert json.loads(state_out.get_relation(peer_relation.id).local_app_data["rollout"])["granted"] == []
+
+
+def test_rollout_not_released_on_stale_check(context, state, temporal_ui_container_initialized, peer_relation):
+    state = dataclasses.replace(state, containers=[temporal_ui_container_initialized])
+    state_out = context.run(context.on.config_changed(), state)
+
+    # The `up` check still reports UP from before the replan, but the new instance does not answer.
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    with unittest.mock.patch("charm.probe_latency", return_value=None):
+        state_out = context.run(context.on.update_status(), state_out)
+
+    assert json.loads(state_out.get_relation(peer_relation.id).local_unit_data["rollout"])["status"] == "applying"
+    assert json.loads(state_out.get_relation(peer_relation.id).local_app_data["rollout"])["granted"] == [
+        "temporal-ui-k8s/0"
+    ]
+
+
+def test_rollout_waits_for_lock(context, state, temporal_ui_container_initialized, peer_relation):
+    lock = {"granted": ["temporal-ui-k8s/1"], "canary": "temporal-ui-k8s/1", "paused": False, "resumed_at": 0}
+    peer_relation = dataclasses.replace(
+        peer_relation,
+        local_app_data={**peer_relation.local_app_data, "rollout": json.dumps(lock)},
+        peers_data={1: {"rollout": json.dumps({"status": "applying", "revision": "abc", "applied_at": 0})}},
+    )
+    state = dataclasses.replace(
+        state,
+        leader=False,
+        containers=[temporal_ui_container_initialized],
+        relations=[peer_relation, *[r for r in state.relations if r.endpoint != "peer"]],
+    )
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    assert state_out.unit_status == ops.WaitingStatus("waiting for rollout lock")
+    assert json.loads(state_out.get_relation(peer_relation.id).local_unit_data["rollout"])["status"] == "requested"
+    assert "TEMPORAL_UI_PORT" not in state_out.get_container("temporal-ui").plan.to_dict()["services"][
+        "temporal-ui"
+    ].get("environment", {})
+
+
+def test_rollout_paused_by_failed_unit(context, state, temporal_ui_container_initialized, peer_relation):
+    failure = {"status": "failed", "revision": "abc", "failed_at": 100}
+    peer_relation = dataclasses.replace(peer_relation, peers_data={1: {"rollout": json.dumps(failure)}})
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container_initialized],
+        relations=[peer_relation, *[r for r in state.relations if r.endpoint != "peer"]],
+    )
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    lock = json.loads(state_out.get_relation(peer_relation.id).local_app_data["rollout"])
+    assert lock["paused"]
+    assert lock["granted"] == []
+    assert state_out.unit_status == ops.WaitingStatus("waiting for rollout lock")
+
+    state_out = context.run(context.on.action("resume-rollout"), state_out)
+
+    lock = json.loads(state_out.get_relation(peer_relation.id).local_app_data["rollout"])
+    assert not lock["paused"]
+    assert lock["granted"] == ["temporal-ui-k8s/0"]
+
+
+class IngressProviderCharm(ops.CharmBase):
+    """Ingress provider reading the requirer data as Traefik does.
+
+    Attrs:
+        ingress: the ingress provider.
+    """
+
+    def __init__(self, framework):
+        """Construct.
+
+        Args:
+            framework: the ops framework.
+        """
+        super().__init__(framework)
+        self.ingress = ingress.IngressPerAppProvider(self)
+
+
+def ingress_provider_data(requirer_relation):
+    """Load the data published by the charm as the Traefik ingress provider does.
+
+    Args:
+        requirer_relation: the ingress relation as seen by the charm.
+
+    Returns:
+        The requirer data validated by the provider.
+    """
+    context = ops.testing.Context(
+        IngressProviderCharm, meta={"name": "traefik", "provides": {"ingress": {"interface": "ingress"}}}
+    )
+    relation = ops.testing.Relation(
+        "ingress",
+        remote_app_name="temporal-ui-k8s",
+        remote_app_data=requirer_relation.local_app_data,
+        remote_units_data={0: requirer_relation.local_unit_data},
+    )
+    with context(context.on.update_status(), ops.testing.State(leader=True, relations=[relation])) as manager:
+        return manager.charm.ingress.get_data(manager.charm.model.get_relation("ingress"))
+
+
+@pytest.fixture
+def restart_state(state, temporal_ui_container_initialized, peer_relation, ui_relation, traefik_ingress_relation):
+    return dataclasses.replace(
+        state,
+        containers=[temporal_ui_container_initialized],
+        relations=[peer_relation, ui_relation, traefik_ingress_relation],
+    )
+
+
+def test_restart_withdraws_before_restarting(
+    context, restart_state, temporal_ui_container_initialized, traefik_ingress_relation
+):
+    state_out = context.run(context.on.relation_joined(traefik_ingress_relation), restart_state)
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    marker = temporal_ui_container_initialized.get_filesystem(context) / "tmp/temporal-ui-withdrawn"
+
+    def drain(port, timeout):
+        """Check that the unit is not ready before it is drained and restarted.
+
+        Args:
+            port: port drained.
+            timeout: seconds the drain may last.
+
+        Returns:
+            The drain duration.
+        """
+        assert marker.exists()
+        return 2.0
+
+    with unittest.mock.patch("charm.time.sleep") as sleep, unittest.mock.patch(
+        "charm.wait_for_drain", side_effect=drain
+    ) as wait_for_drain, unittest.mock.patch("charm.wait_until_ready", return_value=1.5), unittest.mock.patch(
+        "charm.probe_latency", return_value=0.1
+    ):
+        state_out = context.run(context.on.action("restart"), state_out)
+        sleep.assert_called_once_with(15)
+        wait_for_drain.assert_called_once_with(8080, 30)
+
+    assert context.action_results == {
+        "result": "worker successfully restarted",
+        "drain-duration": "2.0s",
+        "time-to-ready": "1.5s",
+    }
+    assert not marker.exists()
+    assert not stored(state_out)["withdrawn"]
+    assert state_out.unit_status == ops.ActiveStatus()
+
+
+def test_restart_stays_withdrawn_when_not_ready(
+    context, restart_state, temporal_ui_container_initialized, traefik_ingress_relation
+):
+    state_out = context.run(context.on.relation_joined(traefik_ingress_relation), restart_state)
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    marker = temporal_ui_container_initialized.get_filesystem(context) / "tmp/temporal-ui-withdrawn"
+
+    with unittest.mock.patch("charm.time.sleep"), unittest.mock.patch(
+        "charm.wait_for_drain", return_value=0.0
+    ), unittest.mock.patch("charm.wait_until_ready", side_effect=TimeoutError("not ready")):
+        with pytest.raises(ops.testing.ActionFailed, match="not ready") as failure:
+            context.run(context.on.action("restart"), state_out)
+
+    state_out = failure.value.state
+    assert marker.exists()
+    assert stored(state_out)["withdrawn"]
+    assert state_out.unit_status == ops.BlockedStatus("ui not ready after restart, kept out of the ingress")
+    # A withdrawn unit keeps a valid databag, so the provider keeps routing to the other units.
+    data = ingress_provider_data(state_out.get_relation(traefik_ingress_relation.id))
+    assert [unit.host for unit in data.units] == [
+        json.loads(state_out.get_relation(traefik_ingress_relation.id).local_unit_data["host"])
+    ]
+
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    with unittest.mock.patch("charm.probe_latency", return_value=0.1):
+        state_out = context.run(context.on.update_status(), state_out)
+
+    assert not marker.exists()
+    assert not stored(state_out)["withdrawn"]
+
+
+def test_active_connections(tmp_path):
+    table = tmp_path / "tcp"
+    table.write_text(
+        "  sl  local_address rem_address   st\n"
+        "   0: 00000000:1F90 00000000:0000 0A\n"
+        "   1: 0100007F:1F90 0100007F:D431 01\n"
+        "   2: 0100007F:1F90 0100007F:D432 01\n"
+        "   3: 0100007F:D431 0100007F:1F90 01\n"
+    )
+
+    assert drain.active_connections(8080, tables=[str(table), str(tmp_path / "missing")]) == 2
+
+
+def test_blue_green_swap(context, state, temporal_ui_container_initialized, peer_relation):
+    temporal_ui_container_running = dataclasses.replace(
+        temporal_ui_container_initialized, service_statuses={"temporal-ui": ops.pebble.ServiceStatus.ACTIVE}
+    )
+    state = dataclasses.replace(state, config={"blue-green-enabled": True}, containers=[temporal_ui_container_running])
+
+    with unittest.mock.patch("charm.wait_until_ready") as ready:
+        state_out = context.run(context.on.config_changed(), state)
+        ready.assert_not_called()
+
+    # The new instance is started, and probed by later hooks.
+    container = state_out.get_container("temporal-ui")
+    plan = container.plan.to_dict()
+    assert plan["services"]["temporal-ui-alt"]["command"] == "./ui-server --env charm-alt start"
+    assert plan["services"]["temporal-ui-alt"]["environment"]["TEMPORAL_UI_PORT"] == 8081
+    assert container.service_statuses["temporal-ui-alt"] == ops.pebble.ServiceStatus.ACTIVE
+    assert container.service_statuses["swap-timer"] == ops.pebble.ServiceStatus.ACTIVE
+    assert state_out.unit_status == ops.MaintenanceStatus("waiting for temporal-ui-alt to be ready")
+    assert stored(state_out)["active_service"] is None
+    assert stored(state_out)["swap_revision"]
+
+    notice = ops.testing.Notice(key="canonical.com/temporal-ui/swap")
+    container = dataclasses.replace(container, notices=[notice], check_infos=[])
+    state_out = dataclasses.replace(state_out, containers=[container])
+    with unittest.mock.patch("charm.probe_latency", return_value=0.1) as probe:
+        state_out = context.run(context.on.pebble_custom_notice(container, notice), state_out)
+        probe.assert_called_once_with("http://localhost:8081/", 5)
+
+    container = state_out.get_container("temporal-ui")
+    plan = container.plan.to_dict()
+    assert plan["checks"]["up"]["http"] == {"url": "http://localhost:8081/"}
+    assert state_out.opened_ports == frozenset({ops.testing.TCPPort(8081)})
+    assert stored(state_out)["active_service"] == "temporal-ui-alt"
+    assert stored(state_out)["swap_revision"] is None
+    assert "active_service" not in state_out.get_relation(peer_relation.id).local_unit_data
+    assert json.loads(state_out.get_relation(peer_relation.id).local_unit_data["rollout"])["status"] == "applying"
+
+    # The new port is only committed when the hook ends, so the previous instance keeps running.
+    assert plan["services"]["temporal-ui"].get("startup") != "disabled"
+    assert container.service_statuses["temporal-ui"] == ops.pebble.ServiceStatus.ACTIVE
+    assert container.service_statuses["retire-timer"] == ops.pebble.ServiceStatus.ACTIVE
+    assert stored(state_out)["retiring_service"] == "temporal-ui"
+
+    notice = ops.testing.Notice(key="canonical.com/temporal-ui/retire")
+    container = dataclasses.replace(container, notices=[notice], check_infos=[])
+    state_out = dataclasses.replace(state_out, containers=[container])
+    with unittest.mock.patch("charm.wait_for_drain", return_value=1.0) as drain:
+        state_out = context.run(context.on.pebble_custom_notice(container, notice), state_out)
+        drain.assert_called_once_with(8080, 30)
+
+    container = state_out.get_container("temporal-ui")
+    assert container.plan.to_dict()["services"]["temporal-ui"]["startup"] == "disabled"
+    assert container.service_statuses["temporal-ui"] == ops.pebble.ServiceStatus.INACTIVE
+    assert container.service_statuses["temporal-ui-alt"] == ops.pebble.ServiceStatus.ACTIVE
+    assert stored(state_out)["retiring_service"] is None
+    assert stored(state_out)["active_service"] == "temporal-ui-alt"
+
+
+def test_blue_green_swap_failure(context, state, temporal_ui_container_initialized, peer_relation):
+    state = dataclasses.replace(
+        state, config={"blue-green-enabled": True}, containers=[temporal_ui_container_initialized]
+    )
+    state_out = context.run(context.on.config_changed(), state)
+
+    notice = ops.testing.Notice(key="canonical.com/temporal-ui/swap")
+    container = dataclasses.replace(state_out.get_container("temporal-ui"), notices=[notice])
+    state_out = dataclasses.replace(state_out, containers=[container])
+    with unittest.mock.patch("charm.probe_latency", return_value=None):
+        state_out = context.run(context.on.pebble_custom_notice(container, notice), state_out)
+
+    # Still within rollout-health-timeout: probed again later.
+    assert state_out.unit_status == ops.MaintenanceStatus("waiting for temporal-ui-alt to be ready")
+    assert stored(state_out)["swap_revision"]
+
+    content = {**stored(state_out), "swap_started_at": 0.0}
+    state_out = dataclasses.replace(state_out, stored_states={stored(state_out, **content)})
+    with unittest.mock.patch("charm.probe_latency", return_value=None):
+        state_out = context.run(context.on.pebble_custom_notice(container, notice), state_out)
+
+    assert state_out.unit_status == ops.BlockedStatus("blue/green swap failed: temporal-ui-alt not ready")
+    assert json.loads(state_out.get_relation(peer_relation.id).local_unit_data["rollout"])["status"] == "failed"
+    assert stored(state_out)["active_service"] is None
+    assert stored(state_out)["swap_revision"] is None
+    assert state_out.get_container("temporal-ui").service_statuses["temporal-ui-alt"] == (
+        ops.pebble.ServiceStatus.INACTIVE
+    )
+
+
+def test_blue_green_invalid_port(context, state, temporal_ui_container):
+    state = dataclasses.replace(state, config={"blue-green-enabled": True, "blue-green-port": 8080})
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus("Invalid config: blue-green-port must differ from port")
+
+
+def test_config_change_debounced(context, state, temporal_ui_container_initialized, peer_relation):
+    state = dataclasses.replace(
+        state, config={"config-debounce-seconds": 60}, containers=[temporal_ui_container_initialized]
+    )
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    container = state_out.get_container("temporal-ui")
+    assert "environment" not in container.plan.to_dict()["services"]["temporal-ui"]
+    assert container.service_statuses["config-debounce"] == ops.pebble.ServiceStatus.ACTIVE
+    assert stored(state_out)["config_pending_since"] is not None
+    assert "config_pending_since" not in state_out.get_relation(peer_relation.id).local_unit_data
+    assert state_out.unit_status == ops.WaitingStatus("applying configuration in 60s")
+
+
+def test_debounced_config_applied_on_notice(context, state, temporal_ui_container_initialized, peer_relation):
+    notice = ops.testing.Notice(key="canonical.com/temporal-ui/config-debounce")
+    temporal_ui_container_notified = dataclasses.replace(temporal_ui_container_initialized, notices=[notice])
+    state = dataclasses.replace(
+        state,
+        config={"config-debounce-seconds": 60},
+        containers=[temporal_ui_container_notified],
+        stored_states=[stored(state, config_pending_since=0)],
+    )
+
+    state_out = context.run(context.on.pebble_custom_notice(temporal_ui_container_notified, notice), state)
+
+    assert state_out.get_container("temporal-ui").plan.to_dict()["services"]["temporal-ui"]["environment"]
+    assert stored(state_out)["config_pending_since"] is None
+
+
+def test_apply_config_skips_debounce(context, state, temporal_ui_container_initialized, peer_relation):
+    state = dataclasses.replace(
+        state, config={"config-debounce-seconds": 60}, containers=[temporal_ui_container_initialized]
+    )
+    state_out = context.run(context.on.config_changed(), state)
+
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    state_out = context.run(context.on.action("apply-config"), state_out)
+
+    assert context.action_results["result"] == "configuration applied"
+    assert state_out.get_container("temporal-ui").plan.to_dict()["services"]["temporal-ui"]["environment"]
+    assert stored(state_out)["config_pending_since"] is None
+
+
+@pytest.fixture
+def cgroup_mount(tmp_path):
+    (tmp_path / "cpu.max").write_text("150000 100000\n")
+    (tmp_path / "memory.max").write_text("1073741824\n")
+    return {"cgroup": ops.testing.Mount(location="/sys/fs/cgroup", source=tmp_path)}
+
+
+def test_go_runtime_derived_from_cgroup(context, state, temporal_ui_container_initialized, cgroup_mount):
+    container = dataclasses.replace(temporal_ui_container_initialized, mounts=cgroup_mount)
+    state = dataclasses.replace(state, containers=[container])
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    environment = state_out.get_container("temporal-ui").plan.to_dict()["services"]["temporal-ui"]["environment"]
+    assert environment["GOMAXPROCS"] == "2"
+    assert environment["GOMEMLIMIT"] == "921MiB"
+    assert "GOGC" not in environment
+
+
+def test_go_runtime_action_with_overrides(context, state, temporal_ui_container_initialized, cgroup_mount):
+    container = dataclasses.replace(temporal_ui_container_initialized, mounts=cgroup_mount)
+    state = dataclasses.replace(state, config={"go-maxprocs": 4, "go-gc": "off"}, containers=[container])
+
+    context.run(context.on.action("go-runtime"), state)
+
+    assert context.action_results == {
+        "cpu-limit": "1.5",
+        "memory-limit": "1073741824",
+        "gomaxprocs": "4",
+        "gomemlimit": "921MiB",
+        "gogc": "off",
+    }
+
+
+def test_go_runtime_action_within_budget(context, state, temporal_ui_container_initialized, cgroup_mount):
+    container = dataclasses.replace(temporal_ui_container_initialized, mounts=cgroup_mount)
+    state = dataclasses.replace(state, config={"hook-time-budget": 0}, containers=[container])
+
+    with pytest.raises(ops.testing.ActionFailed, match="hook time budget exhausted before pebble pull"):
+        context.run(context.on.action("go-runtime"), state)
+
+
+def test_go_runtime_invalid_memlimit(context, state, temporal_ui_container):
+    state = dataclasses.replace(state, config={"go-memlimit": "lots"})
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus("Invalid config: go-memlimit must be a size such as 512MiB")
+
+
+def test_resources_patched(context, state, lightkube_client):
+    state = dataclasses.replace(state, config={"cpu-request": "250m", "cpu-limit": "1", "memory-limit": "1Gi"})
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    patch = lightkube_client.patch.call_args.kwargs["obj"]
+    assert patch["spec"]["template"]["spec"]["containers"] == [
+        {
+            "name": "temporal-ui",
+            "resources": {"requests": {"cpu": "250m"}, "limits": {"cpu": "1", "memory": "1Gi"}},
+        }
+    ]
+    assert state_out.unit_status == ops.MaintenanceStatus("replanning application")
+
+
+def test_resources_reconciled_idempotently(context, state, lightkube_client, statefulset):
+    container = statefulset.spec.template.spec.containers[1]
+    container.resources = ResourceRequirements(requests={"cpu": "0.25"}, limits={"cpu": "1000m", "memory": "1Gi"})
+    state = dataclasses.replace(state, config={"cpu-request": "250m", "cpu-limit": "1", "memory-limit": "1Gi"})
+
+    context.run(context.on.config_changed(), state)
+
+    lightkube_client.patch.assert_not_called()
+
+
+def test_resources_removed(context, state, lightkube_client, statefulset):
+    container = statefulset.spec.template.spec.containers[1]
+    container.resources = ResourceRequirements(limits={"cpu": "1", "memory": "1Gi"})
+    state = dataclasses.replace(state, config={"memory-limit": "2Gi"})
+
+    context.run(context.on.config_changed(), state)
+
+    patch = lightkube_client.patch.call_args.kwargs["obj"]
+    assert patch["spec"]["template"]["spec"]["containers"][0]["resources"] == {
+        "requests": {},
+        "limits": {"cpu": None, "memory": "2Gi"},
+    }
+
+
+def test_resources_request_exceeds_limit(context, state, temporal_ui_container, lightkube_client):
+    state = dataclasses.replace(state, config={"memory-request": "2Gi", "memory-limit": "1Gi"})
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    lightkube_client.patch.assert_not_called()
+    assert state_out.unit_status == ops.BlockedStatus("Invalid config: memory-request exceeds memory-limit")
+
+
+def test_resources_patch_forbidden(context, state, lightkube_client):
+    response = unittest.mock.MagicMock()
+    response.json.return_value = {"code": 403, "reason": "Forbidden", "message": "forbidden"}
+    lightkube_client.patch.side_effect = ApiError(response=response)
+    state = dataclasses.replace(state, config={"cpu-limit": "1"})
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    assert state_out.unit_status == ops.BlockedStatus("failed to patch the StatefulSet: Forbidden")
+
+
+def test_resources_unset_without_trust(context, state, lightkube_client):
+    response = unittest.mock.MagicMock()
+    response.json.return_value = {"code": 403, "reason": "Forbidden", "message": "forbidden"}
+    lightkube_client.get.side_effect = ApiError(response=response)
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    assert state_out.unit_status == ops.MaintenanceStatus("replanning application")
+
+
+def test_pod_spread_patched_with_resources(context, state, lightkube_client):
+    state = dataclasses.replace(state, config={"pod-spread": "hard", "memory-limit": "1Gi"})
+
+    context.run(context.on.config_changed(), state)
+
+    lightkube_client.patch.assert_called_once()
+    pod_spec = lightkube_client.patch.call_args.kwargs["obj"]["spec"]["template"]["spec"]
+    assert pod_spec["containers"][0]["resources"]["limits"] == {"memory": "1Gi"}
+    assert [c["topologyKey"] for c in pod_spec["topologySpreadConstraints"]] == [
+        "kubernetes.io/hostname",
+        "topology.kubernetes.io/zone",
+    ]
+    # Only the node spread is enforced, so that clusters without zone labels still schedule pods.
+    assert [c["whenUnsatisfiable"] for c in pod_spec["topologySpreadConstraints"]] == [
+        "DoNotSchedule",
+        "ScheduleAnyway",
+    ]
+    assert pod_spec["topologySpreadConstraints"][0]["labelSelector"] == {
+        "matchLabels": {"app.kubernetes.io/name": "temporal-ui-k8s"}
+    }
+
+
+@pytest.mark.parametrize("mode", ["soft", "hard"])
+def test_pod_spread_zone_never_enforced(mode):
+    constraints = statefulset_module.spread_constraints("temporal-ui-k8s", {"pod-spread": mode})
+
+    policies = {c["topologyKey"]: c["whenUnsatisfiable"] for c in constraints}
+    assert policies["topology.kubernetes.io/zone"] == "ScheduleAnyway"
+    assert policies["kubernetes.io/hostname"] == ("DoNotSchedule" if mode == "hard" else "ScheduleAnyway")
+
+
+def test_pod_spread_reconciled_idempotently(context, state, lightkube_client, statefulset):
+    constraints = statefulset_module.spread_constraints("temporal-ui-k8s", {"pod-spread": "soft"})
+    statefulset.spec.template.spec.topologySpreadConstraints = [
+        TopologySpreadConstraint.from_dict(constraint) for constraint in constraints
+    ]
+    state = dataclasses.replace(state, config={"pod-spread": "soft"})
+
+    context.run(context.on.config_changed(), state)
+
+    lightkube_client.patch.assert_not_called()
+
+
+def test_pod_spread_removed(context, state, lightkube_client, statefulset):
+    constraints = statefulset_module.spread_constraints("temporal-ui-k8s", {"pod-spread": "soft"})
+    statefulset.spec.template.spec.topologySpreadConstraints = [
+        TopologySpreadConstraint.from_dict(constraint) for constraint in constraints
+    ]
+
+    context.run(context.on.config_changed(), state)
+
+    assert lightkube_client.patch.call_args.kwargs["obj"] == {
+        "spec": {"template": {"spec": {"topologySpreadConstraints": None}}}
+    }
+
+
+def test_pod_spread_invalid(context, state, temporal_ui_container, lightkube_client):
+    state = dataclasses.replace(state, config={"pod-spread": "everywhere"})
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    lightkube_client.patch.assert_not_called()
+    assert state_out.unit_status == ops.BlockedStatus("Invalid config: pod-spread must be one of none, soft or hard")
+
+
+def test_frontend_address_from_relation(context, state, temporal_ui_container, ui_relation):
+    ui_relation = dataclasses.replace(
+        ui_relation,
+        remote_app_data={**ui_relation.remote_app_data, "frontend_address": "temporal-k8s-endpoints:7233"},
+    )
+    state = dataclasses.replace(
+        state,
+        config={"frontend-load-balancing": "round-robin"},
+        relations=[ui_relation, *[r for r in state.relations if r.endpoint != "ui"]],
+    )
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    container = state_out.get_container("temporal-ui")
+    environment = container.plan.to_dict()["services"]["temporal-ui"]["environment"]
+    assert environment["TEMPORAL_ADDRESS"] == "dns:///temporal-k8s-endpoints:7233"
+    config = (container.get_filesystem(context) / "home/ui-server/config/charm.yaml").read_text()
+    assert "temporalGrpcAddress: dns:///temporal-k8s-endpoints:7233" in config
+
+
+def test_frontend_address_override(context, state, temporal_ui_container):
+    state = dataclasses.replace(state, config={"frontend-address": "dns:///frontend.example:7233"})
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    environment = state_out.get_container("temporal-ui").plan.to_dict()["services"]["temporal-ui"]["environment"]
+    assert environment["TEMPORAL_ADDRESS"] == "dns:///frontend.example:7233"
+
+
+def test_ingress_healthcheck(context, state, peer_relation, ui_relation, traefik_ingress_relation):
+    state = dataclasses.replace(state, relations=[peer_relation, ui_relation, traefik_ingress_relation])
+
+    state_out = context.run(context.on.relation_joined(traefik_ingress_relation), state)
+
+    app_data = state_out.get_relation(traefik_ingress_relation.id).local_app_data
+    assert json.loads(app_data["healthcheck_params"]) == {"path": "/healthz", "interval": "10s", "timeout": "2s"}
+
+
+def test_ingress_healthcheck_disabled(context, state, peer_relation, ui_relation, traefik_ingress_relation):
+    state = dataclasses.replace(
+        state,
+        config={"ingress-healthcheck-path": ""},
+        relations=[peer_relation, ui_relation, traefik_ingress_relation],
+    )
+
+    state_out = context.run(context.on.relation_joined(traefik_ingress_relation), state)
+
+    assert "healthcheck_params" not in state_out.get_relation(traefik_ingress_relation.id).local_app_data
+
+
+def test_ingress_healthcheck_invalid_interval(context, state, temporal_ui_container):
+    state = dataclasses.replace(state, config={"ingress-healthcheck-interval": "often"})
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus(
+        "Invalid config: ingress-healthcheck-interval must be a duration such as 10s"
+    )
+
+
+def test_ingress_unit_address(context, state, peer_relation, ui_relation, traefik_ingress_relation):
+    state = dataclasses.replace(state, relations=[peer_relation, ui_relation, traefik_ingress_relation])
+
+    state_out = context.run(context.on.relation_joined(traefik_ingress_relation), state)
+
+    # Traefik balances across the host of every unit, so each one publishes its own address.
+    unit_data = state_out.get_relation(traefik_ingress_relation.id).local_unit_data
+    assert json.loads(unit_data["host"]) == socket.getfqdn()
+    assert json.loads(unit_data["ip"]) == "192.0.2.0"
+
+
+def test_session_affinity(context, state, temporal_ui_container, nginx_relation):
+    state = dataclasses.replace(state, config={"session-affinity": True})
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    assert state_out.get_relation(nginx_relation.id).local_app_data["session-cookie-max-age"] == "3600"
+    assert state_out.get_container("temporal-ui").plan.to_dict()["checks"]["up"]["level"] == "ready"
+
+
+def test_session_affinity_disabled(context, state, temporal_ui_container, nginx_relation):
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert "session-cookie-max-age" not in state_out.get_relation(nginx_relation.id).local_app_data
+    assert "level" not in state_out.get_container("temporal-ui").plan.to_dict()["checks"]["up"]
+
+
+def test_nginx_route_knobs(context, state, temporal_ui_container, nginx_relation):
+    state = dataclasses.replace(
+        state,
+        config={
+            "nginx-limit-rps": 20,
+            "nginx-limit-whitelist": "10.0.0.0/8,192.168.1.1",
+            "nginx-max-body-size": 8,
+            "nginx-retry-errors": "error,timeout,http_502",
+            "nginx-enable-access-log": False,
+            "nginx-path-routes": "/",
+        },
+    )
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    app_data = state_out.get_relation(nginx_relation.id).local_app_data
+    assert app_data["limit-rps"] == "20"
+    assert app_data["limit-whitelist"] == "10.0.0.0/8,192.168.1.1"
+    assert app_data["max-body-size"] == "8"
+    assert app_data["retry-errors"] == "error,timeout,http_502"
+    assert app_data["enable-access-log"] == "false"
+    assert app_data["path-routes"] == "/"
+
+
+@pytest.mark.parametrize(
+    "config, message",
+    [
+        ({"nginx-limit-rps": -1}, "Invalid config: nginx-limit-rps must not be negative"),
+        (
+            {"nginx-limit-whitelist": "10.0.0.0/8,nowhere"},
+            "Invalid config: nginx-limit-whitelist entry 'nowhere' is not a CIDR",
+        ),
+        ({"nginx-retry-errors": "error,always"}, "Invalid config: nginx-retry-errors entry 'always' is not supported"),
+        ({"nginx-path-routes": "api"}, "Invalid config: nginx-path-routes entry 'api' must start with /"),
+    ],
+)
+def test_nginx_route_knobs_invalid(context, state, temporal_ui_container, config, message):
+    state = dataclasses.replace(state, config=config)
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus(message)
+
+
+def test_asset_proxy(context, state, temporal_ui_container, ui_proxy_container, nginx_relation, peer_relation):
+    state = dataclasses.replace(
+        state, config={"asset-proxy-enabled": True}, containers=[temporal_ui_container, ui_proxy_container]
+    )
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    container = state_out.get_container("ui-proxy")
+    plan = container.plan.to_dict()
+    assert plan["services"]["ui-proxy"]["command"] == "nginx -c /etc/nginx/ui-proxy.conf -g 'daemon off;'"
+    assert plan["services"]["ui-proxy-warmup"]["startup"] == "disabled"
+    assert plan["checks"]["proxy-up"]["http"] == {"url": "http://localhost:8088/proxy-healthz"}
+    assert container.service_statuses["ui-proxy"] == ops.pebble.ServiceStatus.ACTIVE
+    assert container.service_statuses["ui-proxy-warmup"] == ops.pebble.ServiceStatus.ACTIVE
+
+    config = container.get_filesystem(context).joinpath("etc/nginx/ui-proxy.conf").read_text()
+    assert "listen 8088;" in config
+    assert "server 127.0.0.1:8080;" in config
+    assert 'add_header Cache-Control "public, max-age=31536000, immutable";' in config
+
+    assert state_out.opened_ports == frozenset({ops.testing.TCPPort(8088)})
+    assert state_out.get_relation(nginx_relation.id).local_app_data["service-port"] == "8088"
+    assert stored(state_out)["ui_proxy_started"]
+
+
+def test_asset_proxy_reloaded_on_change(context, state, temporal_ui_container, ui_proxy_container):
+    ui_proxy_running = dataclasses.replace(
+        ui_proxy_container,
+        layers={"ui-proxy": ops.pebble.Layer({"services": {"ui-proxy": {"override": "replace", "command": "nginx"}}})},
+        service_statuses={"ui-proxy": ops.pebble.ServiceStatus.ACTIVE},
+    )
+    state = dataclasses.replace(
+        state,
+        config={"asset-proxy-enabled": True, "asset-cache-size": "1g"},
+        containers=[temporal_ui_container, ui_proxy_running],
+    )
+
+    context.run(context.on.config_changed(), state)
+
+    assert context.exec_history["ui-proxy"][0].command == ["nginx", "-s", "reload", "-c", "/etc/nginx/ui-proxy.conf"]
+
+
+def test_asset_proxy_disabled(context, state, temporal_ui_container, ui_proxy_container, peer_relation):
+    ui_proxy_running = dataclasses.replace(
+        ui_proxy_container,
+        layers={"ui-proxy": ops.pebble.Layer({"services": {"ui-proxy": {"override": "replace", "command": "nginx"}}})},
+        service_statuses={"ui-proxy": ops.pebble.ServiceStatus.ACTIVE},
+    )
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container, ui_proxy_running],
+        stored_states=[stored(state, ui_proxy_started=True)],
+    )
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    container = state_out.get_container("ui-proxy")
+    assert container.service_statuses["ui-proxy"] == ops.pebble.ServiceStatus.INACTIVE
+    assert container.plan.to_dict()["services"]["ui-proxy"]["startup"] == "disabled"
+    assert not stored(state_out)["ui_proxy_started"]
+    assert state_out.opened_ports == frozenset({ops.testing.TCPPort(8080)})
+
+
+def test_asset_proxy_port_conflict(context, state, temporal_ui_container):
+    state = dataclasses.replace(state, config={"asset-proxy-enabled": True, "asset-proxy-port": 8080})
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus("Invalid config: asset-proxy-port conflicts with another port")
+
+
+def test_api_cache(context, state, temporal_ui_container, ui_proxy_container):
+    state = dataclasses.replace(
+        state,
+        config={"api-cache-enabled": True, "api-cache-ttl": 3},
+        containers=[temporal_ui_container, ui_proxy_container],
+    )
+
+    state_out = context.run(context.on.pebble_ready(ui_proxy_container), state)
+
+    container = state_out.get_container("ui-proxy")
+    filesystem = container.get_filesystem(context)
+    config = filesystem.joinpath("etc/nginx/ui-proxy.conf").read_text()
+    assert "proxy_cache_valid 200 3s;" in config
+    assert "proxy_cache_lock on;" in config
+    assert 'proxy_cache_key "$request_uri|$http_authorization";' in config
+    assert "listen 9113;" in config
+    assert "/_app/immutable/" not in config
+    assert filesystem.joinpath("etc/nginx/njs/ui-proxy-metrics.js").exists()
+    assert container.service_statuses["ui-proxy"] == ops.pebble.ServiceStatus.ACTIVE
+    assert "ui-proxy-warmup" not in container.service_statuses
+    assert state_out.opened_ports == frozenset({ops.testing.TCPPort(8088)})
+
+
+def test_api_cache_keyed_by_credentials(context, state, temporal_ui_container, ui_proxy_container):
+    state = dataclasses.replace(
+        state,
+        config={
+            "api-cache-enabled": True,
+            "auth-enabled": True,
+            "auth-provider-url": "some-provider-url",
+            "auth-client-id": "some-client-id",
+            "auth-client-secret": "some-client-secret",
+        },
+        containers=[temporal_ui_container, ui_proxy_container],
+    )
+
+    state_out = context.run(context.on.pebble_ready(ui_proxy_container), state)
+
+    config = state_out.get_container("ui-proxy").get_filesystem(context).joinpath("etc/nginx/ui-proxy.conf")
+    # Anonymous requests are never served from, nor stored in, the cache.
+    assert '"" 1;' in config.read_text()
+
+
+@pytest.fixture
+def second_ui_relation():
+    return ops.testing.Relation("ui", remote_app_name="temporal-b", remote_app_data={"server_status": "ready"})
+
+
+def test_extra_cluster(context, state, temporal_ui_container, ui_proxy_container, second_ui_relation):
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container, ui_proxy_container],
+        relations=[*state.relations, second_ui_relation],
+    )
+
+    state_out = context.run(context.on.relation_changed(second_ui_relation), state)
+
+    container = state_out.get_container("temporal-ui")
+    services = container.plan.to_dict()["services"]
+    assert services["temporal-ui"]["environment"]["TEMPORAL_ADDRESS"] == "remote:7233"
+    service = services["temporal-ui-temporal-b"]
+    assert service["command"] == "./ui-server --env cluster-temporal-b start"
+    assert service["environment"]["TEMPORAL_ADDRESS"] == "temporal-b:7233"
+    assert service["environment"]["TEMPORAL_UI_PORT"] == 8100
+    assert service["environment"]["TEMPORAL_UI_PUBLIC_PATH"] == "/temporal-b"
+    config = container.get_filesystem(context).joinpath("home/ui-server/config/cluster-temporal-b.yaml")
+    assert "publicPath: /temporal-b" in config.read_text()
+
+    proxy_config = state_out.get_container("ui-proxy").get_filesystem(context).joinpath("etc/nginx/ui-proxy.conf")
+    assert "location /temporal-b/ {\n            proxy_pass http://127.0.0.1:8100;" in proxy_config.read_text()
+    assert state_out.opened_ports == frozenset({ops.testing.TCPPort(8088)})
+    assert state_out.unit_status == ops.MaintenanceStatus("replanning application")
+
+
+def test_extra_cluster_not_ready(context, state, temporal_ui_container, ui_proxy_container, second_ui_relation):
+    second_ui_relation = dataclasses.replace(second_ui_relation, remote_app_data={})
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container, ui_proxy_container],
+        relations=[*state.relations, second_ui_relation],
+    )
+
+    state_out = context.run(context.on.relation_changed(second_ui_relation), state)
+
+    assert "temporal-ui-temporal-b" not in state_out.get_container("temporal-ui").plan.to_dict()["services"]
+    assert state_out.unit_status == ops.MaintenanceStatus("replanning application")
+
+
+def test_extra_cluster_removed(
+    context, state, temporal_ui_container_initialized, ui_proxy_container, second_ui_relation
+):
+    layer = ops.pebble.Layer(
+        {"services": {"temporal-ui-temporal-b": {"override": "replace", "command": "x", "startup": "enabled"}}}
+    )
+    temporal_ui_container_clustered = dataclasses.replace(
+        temporal_ui_container_initialized,
+        layers={**temporal_ui_container_initialized.layers, "temporal-ui-b": layer},
+        service_statuses={"temporal-ui-temporal-b": ops.pebble.ServiceStatus.ACTIVE},
+    )
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container_clustered, ui_proxy_container],
+        relations=[*state.relations, second_ui_relation],
+    )
+
+    state_out = context.run(context.on.relation_broken(second_ui_relation), state)
+
+    container = state_out.get_container("temporal-ui")
+    assert container.plan.to_dict()["services"]["temporal-ui-temporal-b"]["startup"] == "disabled"
+    assert container.service_statuses["temporal-ui-temporal-b"] == ops.pebble.ServiceStatus.INACTIVE
+
+
+def test_extra_cluster_with_blue_green(context, state, temporal_ui_container, second_ui_relation):
+    state = dataclasses.replace(
+        state, config={"blue-green-enabled": True}, relations=[*state.relations, second_ui_relation]
+    )
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus(
+        "Invalid config: blue-green-enabled requires a single ui relation"
+    )
+
+
+@pytest.mark.parametrize(
+    "setting,proxy,expected",
+    [
+        ("auto", None, False),
+        ("auto", "http://squid.internal:3128", True),
+        ("false", "http://squid.internal:3128", False),
+        ("true", None, True),
+    ],
+)
+def test_notify_on_new_version(context, state, temporal_ui_container, monkeypatch, setting, proxy, expected):
+    if proxy:
+        monkeypatch.setenv("JUJU_CHARM_HTTP_PROXY", proxy)
+    state = dataclasses.replace(state, config={"notify-on-new-version": setting, "refresh-interval": "5m"})
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    container = state_out.get_container("temporal-ui")
+    environment = container.plan.to_dict()["services"]["temporal-ui"]["environment"]
+    assert environment["TEMPORAL_NOTIFY_ON_NEW_VERSION"] == expected
+    config = container.get_filesystem(context).joinpath("home/ui-server/config/charm.yaml").read_text()
+    assert f"notifyOnNewVersion: {expected}" in config
+    assert "refreshInterval: 5m" in config
+
+
+@pytest.mark.parametrize(
+    "config,message",
+    [
+        ({"refresh-interval": "60"}, "Invalid config: refresh-interval must be a duration such as 1m"),
+        ({"notify-on-new-version": "yes"}, "Invalid config: notify-on-new-version must be one of auto, true or false"),
+    ],
+)
+def test_ui_server_settings_invalid(context, state, temporal_ui_container, config, message):
+    state = dataclasses.replace(state, config=config)
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus(message)
+
+
+def test_ingress_data_not_rewritten(context, state, peer_relation, ui_relation, traefik_ingress_relation):
+    state = dataclasses.replace(state, relations=[peer_relation, ui_relation, traefik_ingress_relation])
+    state_out = context.run(context.on.relation_joined(traefik_ingress_relation), state)
+    traefik_ingress_relation = state_out.get_relation(traefik_ingress_relation.id)
+
+    with context(context.on.relation_changed(traefik_ingress_relation), state_out) as manager:
+        state_out = manager.run()
+        assert manager.charm.ingress.skipped_writes == 2
+
+    relation = state_out.get_relation(traefik_ingress_relation.id)
+    assert relation.local_app_data == traefik_ingress_relation.local_app_data
+    assert relation.local_unit_data == traefik_ingress_relation.local_unit_data
+
+
+def test_ingress_databag_memo_returns_copies():
+    databag = {"host": json.dumps("temporal-ui-k8s-0"), "ip": json.dumps("10.1.1.1")}
+
+    first = ingress.IngressRequirerUnitData.load(databag)
+    first.host = "changed"
+
+    assert ingress.IngressRequirerUnitData.load(databag).host == "temporal-ui-k8s-0"
+
+
+def test_ingress_databag_memo_bounded():
+    for index in range(ingress._LOAD_MEMO_SIZE * 2):
+        ingress.IngressRequirerUnitData.load({"host": json.dumps(f"unit-{index}")})
+
+    assert len(ingress._LOAD_MEMO) == ingress._LOAD_MEMO_SIZE
+
+
+def test_nginx_route_reconciled_on_relevant_hooks_only(context, state, temporal_ui_container_initialized):
+    nginx_relation = ops.testing.Relation("nginx-route", local_app_data={"stray-key": "value"})
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container_initialized],
+        relations=[nginx_relation, *[r for r in state.relations if r.endpoint != "nginx-route"]],
+    )
+
+    state_out = context.run(context.on.update_status(), state)
+
+    assert state_out.get_relation(nginx_relation.id).local_app_data == {"stray-key": "value"}
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    app_data = state_out.get_relation(nginx_relation.id).local_app_data
+    assert "stray-key" not in app_data
+    assert app_data["service-port"] == UI_PORT
+
+
+def test_pod_ip(tmp_path):
+    hosts = tmp_path / "hosts"
+    hosts.write_text(
+        "# Kubernetes-managed hosts file.\n"
+        "127.0.0.1\tlocalhost\n"
+        "10.1.157.92\ttemporal-ui-k8s-0.temporal-ui-k8s-endpoints.temporal.svc.cluster.local\ttemporal-ui-k8s-0\n"
+    )
+
+    assert host_facts.pod_ip("temporal-ui-k8s-0", hosts) == "10.1.157.92"
+    assert host_facts.pod_ip("other", hosts) is None
+    assert host_facts.pod_ip("temporal-ui-k8s-0", tmp_path / "missing") is None
+
+
+def test_host_facts_cached_across_hooks(context, state, peer_relation, ui_relation, traefik_ingress_relation):
+    state = dataclasses.replace(state, relations=[peer_relation, ui_relation, traefik_ingress_relation])
+
+    with unittest.mock.patch("host_facts.socket.getfqdn", return_value="unit-0.example.com") as getfqdn:
+        state_out = context.run(context.on.relation_joined(traefik_ingress_relation), state)
+        traefik_ingress_relation = state_out.get_relation(traefik_ingress_relation.id)
+        state_out = context.run(context.on.relation_changed(traefik_ingress_relation), state_out)
+        assert getfqdn.call_count == 1
+
+        state_out = context.run(context.on.upgrade_charm(), state_out)
+        assert getfqdn.call_count == 2
+
+    unit_data = state_out.get_relation(traefik_ingress_relation.id).local_unit_data
+    assert json.loads(unit_data["host"]) == "unit-0.example.com"
+    assert json.loads(unit_data["ip"]) == "192.0.2.0"
+
+
+def test_pebble_calls_retried_with_backoff():
+    calls = pebble_calls.PebbleCalls(budget=60)
+    func = unittest.mock.Mock(side_effect=[ops.pebble.ConnectionError("busy"), ops.pebble.TimeoutError("slow"), "ok"])
+
+    with unittest.mock.patch("pebble_calls.time.sleep") as sleep:
+        assert calls.run("replan", func) == "ok"
+
+    assert func.call_count == 3
+    assert 0 < func.call_args.kwargs["timeout"] <= pebble_calls.OPERATION_TIMEOUTS["replan"]
+    assert sleep.call_count == 2
+    assert [(operation, attempts) for operation, _, attempts in calls.timings] == [("replan", 3)]
+
+
+def test_pebble_calls_retries_bounded():
+    calls = pebble_calls.PebbleCalls(budget=60, retries=1)
+    func = unittest.mock.Mock(side_effect=ops.pebble.ConnectionError("down"))
+
+    with unittest.mock.patch("pebble_calls.time.sleep"), pytest.raises(
+        pebble_calls.HookBudgetExceededError, match="still failing after 2 attempts"
+    ):
+        calls.run("get_plan", func)
+
+    assert func.call_count == 2
+    assert "timeout" not in func.call_args.kwargs
+
+
+def test_hook_deferred_when_pebble_keeps_failing(context, state, temporal_ui_container_initialized):
+    state = dataclasses.replace(state, containers=[temporal_ui_container_initialized])
+
+    with unittest.mock.patch("pebble_calls.time.sleep"), unittest.mock.patch(
+        "ops.model.Container.push", side_effect=ops.pebble.ConnectionError("down")
+    ):
+        state_out = context.run(context.on.config_changed(), state)
+
+    assert state_out.unit_status == ops.WaitingStatus("hook time budget exhausted, retrying")
+    assert [event.name for event in state_out.deferred] == ["config_changed"]
+
+
+def test_update_status_tolerates_pebble_timeouts(context, state, temporal_ui_container_initialized):
+    state = dataclasses.replace(state, containers=[temporal_ui_container_initialized])
+
+    with unittest.mock.patch("pebble_calls.time.sleep"), unittest.mock.patch(
+        "ops.model.Container.get_check", side_effect=ops.pebble.TimeoutError("slow")
+    ) as get_check:
+        context.run(context.on.update_status(), state)
+
+    assert get_check.call_count == pebble_calls.RETRIES + 1
+
+
+def test_hook_deferred_when_budget_exhausted(context, state, temporal_ui_container_initialized):
+    state = dataclasses.replace(state, containers=[temporal_ui_container_initialized], config={"hook-time-budget": 0})
+
+    state_out = context.run(context.on.config_changed(), state)
+
+    assert state_out.unit_status == ops.WaitingStatus("hook time budget exhausted, retrying")
+    assert [event.name for event in state_out.deferred] == ["config_changed"]
+    assert state_out.get_container("temporal-ui").plan == temporal_ui_container_initialized.plan
+
+
+def test_restart_fails_when_budget_exhausted(context, restart_state):
+    state = dataclasses.replace(restart_state, config={"hook-time-budget": 0})
+
+    with pytest.raises(ops.testing.ActionFailed, match="hook time budget exhausted"):
+        context.run(context.on.action("restart"), state)
+
+
+def test_health_aggregated_on_leader(context, state, temporal_ui_container_initialized, peer_relation):
+    peer_relation = dataclasses.replace(
+        peer_relation,
+        peers_data={
+            1: {"health": json.dumps({"up": True, "latency-ms": 80, "restarts": 0, "at": 0})},
+            2: {"health": json.dumps({"up": True, "latency-ms": 200, "restarts": 1, "at": 0})},
+            3: {"health": json.dumps({"up": False, "latency-ms": None, "restarts": 4, "at": 0})},
+            4: {},
+        },
+    )
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container_initialized],
+        relations=[peer_relation, *[r for r in state.relations if r.endpoint != "peer"]],
+    )
+
+    with unittest.mock.patch("charm.probe_latency", return_value=0.12):
+        state_out = context.run(context.on.update_status(), state)
+
+    summary = json.loads(state_out.get_relation(peer_relation.id).local_unit_data["health"])
+    assert summary["up"] is True
+    assert summary["latency-ms"] == 120
+    assert state_out.app_status == ops.ActiveStatus("3/5 units ready, p95 200ms")
+
+    with unittest.mock.patch("charm.probe_latency", return_value=0.12):
+        state_out = context.run(context.on.update_status(), dataclasses.replace(state, config={"min-ready-units": 4}))
+
+    assert state_out.app_status == ops.ActiveStatus("degraded, below min-ready-units: 3/5 units ready, p95 200ms")
+
+
+def test_health_publish_rate_limited(context, state, temporal_ui_container_initialized, peer_relation):
+    published = json.dumps({"up": True, "latency-ms": 100, "restarts": 0, "at": 2**31})
+    peer_relation = dataclasses.replace(peer_relation, local_unit_data={"health": published})
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container_initialized],
+        relations=[peer_relation, *[r for r in state.relations if r.endpoint != "peer"]],
+    )
+
+    with unittest.mock.patch("charm.probe_latency", return_value=0.3):
+        state_out = context.run(context.on.update_status(), state)
+
+    assert state_out.get_relation(peer_relation.id).local_unit_data["health"] == published
+
+    down = ops.testing.CheckInfo("up", status=ops.pebble.CheckStatus.DOWN)
+    container = dataclasses.replace(temporal_ui_container_initialized, check_infos=[down])
+    state_out = context.run(context.on.update_status(), dataclasses.replace(state, containers=[container]))
+
+    assert json.loads(state_out.get_relation(peer_relation.id).local_unit_data["health"])["up"] is False
+
+
+def test_percentile():
+    assert health.percentile([], 95) is None
+    assert health.percentile([30, 10, 20], 50) == 20
+    assert health.percentile(list(range(1, 101)), 95) == 95
+
+
+def test_plan_diff(context, state, temporal_ui_container_initialized, tmp_path):
+    container = dataclasses.replace(
+        temporal_ui_container_initialized,
+        mounts={"config": ops.testing.Mount(location="/home/ui-server/config", source=tmp_path)},
+    )
+    state = dataclasses.replace(state, containers=[container])
+
+    state_out = context.run(context.on.config_changed(), state)
+    # The layer added by the charm replaced the check the fixture reports the status of.
+    state_out = dataclasses.replace(
+        state_out, containers=[dataclasses.replace(state_out.get_container("temporal-ui"), check_infos=[])]
+    )
+    context.run(context.on.action("plan-diff"), state_out)
+
+    assert context.action_results == {
+        "push": "no",
+        "layer-change": "no",
+        "replan": "no",
+        "restart": "no",
+        "reasons": "the workload is up to date",
+        "config-diff": "",
+    }
+
+    context.run(context.on.action("plan-diff"), dataclasses.replace(state_out, config={"default-namespace": "orders"}))
+
+    results = context.action_results
+    assert results["push"] == "yes"
+    assert results["replan"] == "yes"
+    assert results["restart"] == "yes, temporal-ui after acquiring the rollout lock"
+    reasons = results["reasons"].splitlines()
+    assert "/home/ui-server/config/charm.yaml changed" in reasons
+    assert "service temporal-ui: environment.TEMPORAL_DEFAULT_NAMESPACE: default -> orders" in reasons
+    assert "-defaultNamespace: default\n+defaultNamespace: orders\n" in results["config-diff"]
+    assert (tmp_path / "charm.yaml").read_text().count("defaultNamespace: default\n") == 1
+
+
+def test_plan_diff_redacts_secrets(
+    context, state, temporal_ui_container_initialized, config_with_auth_enabled, tmp_path
+):
+    container = dataclasses.replace(
+        temporal_ui_container_initialized,
+        mounts={"config": ops.testing.Mount(location="/home/ui-server/config", source=tmp_path)},
+    )
+    state = dataclasses.replace(state, containers=[container], config=config_with_auth_enabled)
+
+    context.run(context.on.action("plan-diff"), state)
+
+    results = context.action_results
+    assert "clientSecret: <redacted>" in results["config-diff"]
+    reasons = results["reasons"].splitlines()
+    assert "service temporal-ui: environment.TEMPORAL_AUTH_CLIENT_SECRET: <redacted> -> <redacted>" in reasons
+    assert not any("some-client-secret" in value for value in results.values())
+
+    state_out = context.run(context.on.config_changed(), state)
+    state_out = dataclasses.replace(
+        state_out,
+        containers=[dataclasses.replace(state_out.get_container("temporal-ui"), check_infos=[])],
+        config={**config_with_auth_enabled, "auth-client-secret": "rotated-client-secret"},
+    )
+    context.run(context.on.action("plan-diff"), state_out)
+
+    results = context.action_results
+    assert results["push"] == "yes"
+    assert "+      clientSecret: <redacted>" in results["config-diff"].splitlines()
+    assert not any("client-secret" in value for value in results.values())
+
+
+def test_plan_diff_blue_green(context, state, temporal_ui_container_initialized):
+    temporal_ui_container_running = dataclasses.replace(
+        temporal_ui_container_initialized, service_statuses={"temporal-ui": ops.pebble.ServiceStatus.ACTIVE}
+    )
+    state = dataclasses.replace(state, config={"blue-green-enabled": True}, containers=[temporal_ui_container_running])
+
+    context.run(context.on.action("plan-diff"), state)
+
+    results = context.action_results
+    assert results["replan"] == "yes"
+    assert results["restart"] == "no, the new configuration would be started next to the running one and swapped in"
+
+
+def test_log_targets(context, state, temporal_ui_container_initialized):
+    logging_relation = ops.testing.Relation(
+        "logging",
+        remote_units_data={0: {"endpoint": json.dumps({"url": "http://loki-0:3100/loki/api/v1/push"})}},
+    )
+    state = dataclasses.replace(
+        state,
+        containers=[temporal_ui_container_initialized],
+        relations=[*state.relations, logging_relation],
+        config={"loki-endpoint": "http://127.0.0.1:3100/loki/api/v1/push"},
+    )
+
+    state_out = context.run(context.on.relation_changed(logging_relation, remote_unit=0), state)
+
+    targets = {
+        name: target.to_dict() for name, target in state_out.get_container("temporal-ui").plan.log_targets.items()
+    }
+    assert targets["loki-0"]["location"] == "http://127.0.0.1:3100/loki/api/v1/push"
+    assert targets["loki-1"]["location"] == "http://loki-0:3100/loki/api/v1/push"
+    assert targets["loki-1"]["services"] == ["temporal-ui"]
+    assert targets["loki-1"]["labels"]["juju_unit"] == "temporal-ui-k8s/0"
+
+    # The layer added by the charm replaced the check the fixture reports the status of.
+    container = dataclasses.replace(state_out.get_container("temporal-ui"), check_infos=[])
+    state_out = dataclasses.replace(state_out, containers=[container], config={})
+    state_out = context.run(context.on.relation_broken(state_out.get_relation(logging_relation.id)), state_out)
+
+    targets = state_out.get_container("temporal-ui").plan.log_targets
+    assert targets["loki-0"].services[-1] == "-all"
+    assert targets["loki-1"].services[-1] == "-all"
+
+
+def test_log_level_override(context, state, temporal_ui_container_initialized, peer_relation):
+    state = dataclasses.replace(state, containers=[temporal_ui_container_initialized])
+
+    state_out = context.run(context.on.action("set-log-level", params={"level": "debug"}), state)
+
+    assert context.action_results["log-level"] == "debug"
+    assert stored(state_out)["log_level"] == "debug"
+    assert "log_level" not in state_out.get_relation(peer_relation.id).local_unit_data
+    assert state_out.get_container("temporal-ui").plan.services["temporal-ui"].environment["LOG_LEVEL"] == "debug"
+
+    state_out = dataclasses.replace(state_out, containers=[temporal_ui_container_initialized])
+    state_out = context.run(context.on.action("set-log-level"), state_out)
+
+    assert context.action_results["log-level"] == "info"
+    assert stored(state_out)["log_level"] is None
+
+
+def test_log_level_override_invalid(context, state, temporal_ui_container_initialized):
+    state = dataclasses.replace(state, containers=[temporal_ui_container_initialized])
+
+    with pytest.raises(ops.testing.ActionFailed, match="level must be one of"):
+        context.run(context.on.action("set-log-level", params={"level": "verbose"}), state)
+
+
+@pytest.mark.parametrize(
+    "target,host",
+    [
+        ("temporal-k8s:7233", "temporal-k8s"),
+        (
+            "dns:///temporal-k8s-headless.temporal.svc.cluster.local:7233",
+            "temporal-k8s-headless.temporal.svc.cluster.local",
+        ),
+        ("https://codec.example.com:8888/codec", "codec.example.com"),
+        ("[fd00::1]:7233", "fd00::1"),
+        ("", None),
+    ],
+)
+def test_target_host(target, host):
+    assert no_proxy.target_host(target) == host
+
+
+def test_no_proxy_extended(context, state, temporal_ui_container, monkeypatch):
+    monkeypatch.setenv("JUJU_CHARM_HTTP_PROXY", "http://squid.internal:3128")
+    monkeypatch.setenv("JUJU_CHARM_NO_PROXY", "127.0.0.1,localhost")
+    state = dataclasses.replace(
+        state,
+        config={"codec-endpoint": "https://codec.example.com:8888", "no-proxy-cidrs": "10.152.183.0/24"},
+    )
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    environment = state_out.get_container("temporal-ui").plan.services["temporal-ui"].environment
+    assert environment["NO_PROXY"] == (
+        "127.0.0.1,localhost,remote,codec.example.com,.svc,.cluster.local,192.0.2.0/32,10.152.183.0/24"
+    )
+
+    context.run(context.on.action("proxy-bypass"), state)
+
+    assert context.action_results == {"no-proxy": environment["NO_PROXY"], "applied": "yes"}
+
+
+def test_no_proxy_cidrs_invalid(context, state, temporal_ui_container):
+    state = dataclasses.replace(state, config={"no-proxy-cidrs": "10.152.183.0/24,cluster"})
+
+    state_out = context.run(context.on.pebble_ready(temporal_ui_container), state)
+
+    assert state_out.unit_status == ops.BlockedStatus("Invalid config: no-proxy-cidrs entry 'cluster' is not a CIDR")